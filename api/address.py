@@ -0,0 +1,362 @@
+"""
+Scored address parsing: find the divisions (province, district, ward) that best explain an address string.
+
+The address is split into parts, at commas. Each part is looked up in tables of names prepared in advance:
+names without accents, in lower case, and without their division type ("Phường", "Quận", "Thành phố"...).
+The tables also have the aliases of the dictionary (see `aliases.py`), like "Sài Gòn", and division types are
+recognized by their abbreviations too, like "P." or "TP.", so alias resolution costs nothing per address.
+This gives the divisions the part may name, each with a quality from 0 to 1, depending on how the division type
+in the part agrees with the name. Parts that don't name any division are looked up again by their word spans,
+like "ha noi" in "Hà Nội Việt Nam", at a lower quality.
+
+Then a beam search goes down the levels, from province to ward, keeping the `BEAM_WIDTH` best combinations
+whose divisions are consistent with each other (the ward is in the district, which is in the province).
+A level which is not in the address is filled in from the lower levels found, but doesn't add to the score:
+between "Phường Lào Cai" (and its province) and the province "Lào Cai", the latter is preferred.
+The best combination is only taken as the answer if it is good enough, and clearly better than the others
+going as deep: "12 Nguyễn Trãi" names no division, rather than one of the wards named "Nguyễn Trãi".
+The number of parts, spans, candidates and combinations are all bounded, so is the time to parse an address.
+"""
+
+import threading
+import unicodedata
+from collections import defaultdict
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from heapq import nlargest
+from operator import itemgetter
+
+from unidecode import unidecode
+
+from .lookup import DivisionIndex
+
+
+# Division types, as folded words. Their abbreviations come from the alias dictionary (see `aliases.py`).
+DIVISION_TYPES = ('tinh', 'thanh pho', 'quan', 'huyen', 'thi xa', 'phuong', 'xa', 'thi tran', 'dac khu')
+DIGITS = '0123456789'
+
+# Quality of a part naming a division, by how its division type agrees with the name
+SAME_PREFIX = 1.0
+NO_PREFIX = 0.9
+SAME_LEVEL_PREFIX = 0.8
+OTHER_LEVEL_PREFIX = 0.5
+# Like "12" for "Phường 12", which many wards are named
+BARE_NUMBER = 0.6
+OTHER_ACCENTS = 0.9
+# Factor for a name from the alias dictionary, so that a division named so in the data comes first.
+# Not for provinces, whose aliases are mostly their names before a merger, like "Bình Dương" for Hồ Chí Minh:
+# the part is then taken as the province rather than as a ward of the same name, like for other province names.
+ALIAS = 0.95
+# Factor for a span of the words of a part, on top of the share of words it covers
+SPAN = 0.8
+MIN_SPAN_COVERAGE = 0.5
+MAX_SPAN_WORDS = 5
+# Only the last parts are looked at, the divisions are at the end of an address.
+MAX_PARTS = 8
+MAX_CANDIDATES = 50
+# Also the maximum number of matches, at least the `k` allowed by the candidates endpoints
+BEAM_WIDTH = 10
+# For the best match to be the answer, sum of its qualities, and by how much it must beat the next one
+MIN_SCORE = 0.35
+MIN_MARGIN = 0.05
+
+
+# (indexes of the parts naming the division, code, quality)
+Candidate = tuple[frozenset[int], int, float]
+# (codes with the upper levels filled in, (sum of qualities, deepest level found, indexes of the parts used))
+Ranked = tuple[tuple[int | None, ...], tuple[float, int, frozenset[int]]]
+
+
+@dataclass(frozen=True)
+class AddressMatch:
+    # Code of the division found at each level, from top to bottom, None if not found
+    codes: tuple[int | None, ...]
+    # From 0 to 1, how well the parts of the address match the names of the divisions
+    confidence: float
+    street: str | None = None
+
+
+class Vocabulary:
+    """
+    How the division types and names may be written in addresses, compiled from the alias dictionary.
+
+    Abbreviations of division types are looked up like the full types, and an abbreviation of one word
+    may be glued to a number, like "Q1" or "P12". Names written with old-style tone marks, like "Hoà",
+    are respelled like in the data, "Hòa".
+    """
+
+    def __init__(
+        self, abbreviations: Mapping[str, Sequence[str]] | None = None, spellings: Mapping[str, str] | None = None
+    ):
+        self.spellings = tuple(
+            (unicodedata.normalize('NFC', old), unicodedata.normalize('NFC', new))
+            for old, new in (spellings or {}).items()
+        )
+        self.glued: frozenset[str] = frozenset()
+        # Division type or abbreviation, as folded words -> division type
+        self.prefixes = {tuple(t.split()): t for t in DIVISION_TYPES}
+        for name, abbreviations_of in (abbreviations or {}).items():
+            division_type = ' '.join(self.tokenize(name)[0])
+            if division_type not in DIVISION_TYPES:
+                raise ValueError(f'Unknown division type: {name}')
+            for abbreviation in abbreviations_of:
+                self.prefixes[tuple(self.tokenize(abbreviation)[0])] = division_type
+        self.glued = frozenset(words[0] for words in self.prefixes if len(words) == 1)
+        self.prefix_lengths = sorted({len(words) for words in self.prefixes}, reverse=True)
+
+    def tokenize(self, text: str) -> tuple[list[str], list[str]]:
+        """Split a name or part of address into words in lower case, without accents and with accents."""
+        text = unicodedata.normalize('NFC', text).lower().replace('.', ' ')
+        for old, new in self.spellings:
+            if old in text:
+                text = text.replace(old, new)
+        accented: list[str] = []
+        for word in text.split():
+            if word == '-':
+                continue
+            if word[-1] in DIGITS and (head := word.rstrip(DIGITS)) in self.glued:
+                accented.extend((head, word[len(head) :]))
+            else:
+                accented.append(word)
+        folded = unidecode(' '.join(accented)).split()
+        # Unlikely, but the words must match one to one
+        return folded, (accented if len(accented) == len(folded) else folded)
+
+    def split_prefix(self, words: Sequence[str]) -> tuple[str | None, int]:
+        """Find the division type the name starts with, like "phuong" in ["phuong", "phuc", "xa"], and its length."""
+        for n in self.prefix_lengths:
+            prefix = self.prefixes.get(tuple(words[:n]))
+            if prefix and len(words) > n:
+                return prefix, n
+        return None, 0
+
+
+def split_parts(address: str) -> tuple[list[str], list[int]]:
+    """
+    Split the address at commas, semicolons and dashes.
+
+    Also tell the parts followed by a dash, which may be inside a name, like "Phường Lâm Viên - Đà Lạt".
+    """
+    parts: list[str] = []
+    dashed: list[int] = []
+    for chunk in address.replace(';', ',').split(','):
+        pieces = chunk.split(' - ')
+        dashed.extend(range(len(parts), len(parts) + len(pieces) - 1))
+        parts.extend(p.strip() for p in pieces)
+    return parts, dashed
+
+
+class Level:
+    """
+    The divisions of one level, with their names and aliases looked up by key: folded name without division type.
+    """
+
+    def __init__(
+        self,
+        index: DivisionIndex,
+        ancestors: dict[int, tuple[int, ...]],
+        vocabulary: Vocabulary,
+        alias_factor: float = ALIAS,
+    ):
+        self.index = index
+        self.vocabulary = vocabulary
+        # Code -> codes of the divisions above, from the top
+        self.ancestors = ancestors
+        # Key -> (code, division type, name with accents but without division type, factor)
+        self.names: defaultdict[str, list[tuple[int, str | None, str, float]]] = defaultdict(list)
+        self.prefixes: set[str] = set()
+        for code in index.order:
+            words, accented = vocabulary.tokenize(index.records[code].name)
+            prefix, n = vocabulary.split_prefix(words)
+            self.names[' '.join(words[n:])].append((code, prefix, ' '.join(accented[n:]), 1))
+            if prefix:
+                self.prefixes.add(prefix)
+            for alias in index.aliases.get(code, ()):
+                words, accented = vocabulary.tokenize(alias)
+                # Without a division type, like "Sài Gòn", the alias has the one of the name.
+                alias_prefix, n = vocabulary.split_prefix(words)
+                self.names[' '.join(words[n:])].append(
+                    (code, alias_prefix or prefix, ' '.join(accented[n:]), alias_factor)
+                )
+
+    def quality(self, prefix: str | None, name_prefix: str | None) -> float:
+        if prefix is None:
+            return NO_PREFIX
+        if prefix == name_prefix:
+            return SAME_PREFIX
+        return SAME_LEVEL_PREFIX if prefix in self.prefixes else OTHER_LEVEL_PREFIX
+
+    def lookup(
+        self, words: Sequence[str], accented: Sequence[str], factor: float = 1, in_span: bool = False
+    ) -> dict[int, float]:
+        """Get the divisions that the words may name, and the quality of each match."""
+        prefix, n = self.vocabulary.split_prefix(words)
+        readings = [(prefix, n)]
+        if prefix:
+            # In case the first words are part of the name, like "Xa La"
+            readings.append((None, 0))
+        found: dict[int, float] = {}
+        for prefix, n in readings:
+            key = ' '.join(words[n:])
+            bare_number = not prefix and key.isdigit()
+            if bare_number and in_span:
+                continue
+            accented_key = ' '.join(accented[n:])
+            for code, name_prefix, name, name_factor in self.names.get(key, ()):
+                quality = (BARE_NUMBER if bare_number else self.quality(prefix, name_prefix)) * factor * name_factor
+                if accented_key != key and accented_key != name:
+                    # Written with accents, but not the ones of this name, like "Sơn Hà" for "Sơn Hạ"
+                    quality *= OTHER_ACCENTS
+                if quality > found.get(code, 0):
+                    found[code] = quality
+        return found
+
+
+class AddressMatcher:
+    """Parse addresses against divisions of several levels. The lookup tables are built on first use, or `warm()`."""
+
+    ready = False
+    levels: tuple[Level, ...]
+
+    def __init__(self, *indexes: DivisionIndex, vocabulary: Vocabulary | None = None):
+        # From top to bottom, each one's `parent_field` pointing to the one above
+        self.indexes = indexes
+        self.vocabulary = vocabulary or Vocabulary()
+        self._lock = threading.Lock()
+
+    def warm(self):
+        if self.ready:
+            return
+        with self._lock:
+            if not self.ready:
+                self.build()
+
+    def build(self):
+        levels = []
+        ancestors: dict[int, tuple[int, ...]] = {c: () for c in self.indexes[0].codes}
+        for i, index in enumerate(self.indexes):
+            if i:
+                parents = ancestors
+                parent_field = index.parent_field
+                assert parent_field
+                ancestors = {}
+                for code, obj in index.records.items():
+                    parent = int(getattr(obj, parent_field))
+                    ancestors[code] = parents[parent] + (parent,)
+            levels.append(Level(index, ancestors, self.vocabulary, 1 if i == 0 else ALIAS))
+        self.levels = tuple(levels)
+        self.ready = True
+
+    def find_candidates(self, parts: Sequence[str], dashed: Sequence[int]) -> list[list[Candidate]]:
+        """Get the candidates of each level, the best ones first."""
+        candidates: list[list[Candidate]] = [[] for _ in self.levels]
+        start = max(0, len(parts) - MAX_PARTS)
+        tokens = {i: self.vocabulary.tokenize(parts[i]) for i in range(start, len(parts))}
+        for i, (words, accented) in tokens.items():
+            if not words:
+                continue
+            found = [level.lookup(words, accented) for level in self.levels]
+            if not any(found):
+                found = [self.lookup_spans(level, words, accented) for level in self.levels]
+            for level_candidates, matches in zip(candidates, found):
+                level_candidates.extend((frozenset((i,)), code, quality) for code, quality in matches.items())
+        # Names with a dash in them
+        for i in dashed:
+            if i < start:
+                continue
+            words = tokens[i][0] + tokens[i + 1][0]
+            accented = tokens[i][1] + tokens[i + 1][1]
+            for level, level_candidates in zip(self.levels, candidates):
+                matches = level.lookup(words, accented)
+                level_candidates.extend((frozenset((i, i + 1)), code, quality) for code, quality in matches.items())
+        return [nlargest(MAX_CANDIDATES, c, key=itemgetter(2)) for c in candidates]
+
+    def lookup_spans(self, level: Level, words: Sequence[str], accented: Sequence[str]) -> dict[int, float]:
+        _prefix, n = self.vocabulary.split_prefix(words)
+        words, accented = words[n:], accented[n:]
+        found: dict[int, float] = {}
+        size = len(words)
+        for n in range(min(size, MAX_SPAN_WORDS), 0, -1):
+            coverage = n / size
+            if coverage < MIN_SPAN_COVERAGE:
+                break
+            for start in range(size - n + 1):
+                end = start + n
+                matches = level.lookup(words[start:end], accented[start:end], SPAN * coverage, in_span=True)
+                for code, quality in matches.items():
+                    if quality > found.get(code, 0):
+                        found[code] = quality
+        return found
+
+    def rank(self, address: str) -> tuple[list[str], list[Ranked]]:
+        """Get the parts of the address, and the combinations of divisions it may name, the most likely first."""
+        self.warm()
+        levels = self.levels
+        parts, dashed = split_parts(address)
+        candidates = self.find_candidates(parts, dashed)
+        # (sum of qualities, codes, indexes of the parts used)
+        beam: list[tuple[float, tuple[int | None, ...], frozenset[int]]] = [(0.0, (), frozenset())]
+        for level, level_candidates in zip(levels, candidates):
+            expanded = []
+            for score, codes, used in beam:
+                expanded.append((score, codes + (None,), used))
+                for part_indexes, code, quality in level_candidates:
+                    if part_indexes & used:
+                        continue
+                    ancestors = level.ancestors[code]
+                    if any(c is not None and c != a for c, a in zip(codes, ancestors)):
+                        continue
+                    expanded.append((score + quality, codes + (code,), used | part_indexes))
+            beam = nlargest(BEAM_WIDTH, expanded, key=itemgetter(0))
+
+        results: dict[tuple[int | None, ...], tuple[float, int, frozenset[int]]] = {}
+        for score, codes, used in beam:
+            deepest = max((i for i, c in enumerate(codes) if c is not None), default=None)
+            if deepest is None:
+                continue
+            deepest_code = codes[deepest]
+            assert deepest_code is not None
+            filled = levels[deepest].ancestors[deepest_code] + codes[deepest:]
+            if filled not in results or score > results[filled][0]:
+                results[filled] = (score, deepest, used)
+        # On equal scores, the upper level wins, then the lower code, to be deterministic.
+        ranked = sorted(results.items(), key=lambda r: (-r[1][0], r[1][1], tuple(c or 0 for c in r[0])))
+        return parts, ranked
+
+    def match(self, address: str, k: int = 5) -> list[AddressMatch]:
+        """
+        Get up to `k` combinations of divisions named in the address, the most likely first.
+
+        If no division is found, the only result has none, and a confidence of 0.
+        """
+        parts, ranked = self.rank(address)
+        if not ranked:
+            return [self.no_match(parts)]
+        return [self.to_match(parts, r) for r in ranked[:k]]
+
+    def best(self, address: str) -> AddressMatch:
+        """
+        Get the divisions named in the address, if it is clear which they are, else none, with a confidence of 0.
+
+        The best combination must score `MIN_SCORE`, and beat by `MIN_MARGIN` the next one whose deepest level found
+        is the same: between wards of the same name in different provinces, none is chosen.
+        """
+        parts, ranked = self.rank(address)
+        if ranked:
+            _codes, (score, deepest, _used) = ranked[0]
+            runner_up = next((s for _c, (s, d, _u) in ranked[1:] if d == deepest), 0.0)
+            if score >= MIN_SCORE and score - runner_up >= MIN_MARGIN:
+                return self.to_match(parts, ranked[0])
+        return self.no_match(parts)
+
+    def to_match(self, parts: Sequence[str], ranked: Ranked) -> AddressMatch:
+        codes, (score, _deepest, used) = ranked
+        return AddressMatch(codes, round(score / len(self.levels), 3), self.find_street(parts, used))
+
+    def no_match(self, parts: Sequence[str]) -> AddressMatch:
+        return AddressMatch((None,) * len(self.levels), 0.0, self.find_street(parts, frozenset()))
+
+    @staticmethod
+    def find_street(parts: Sequence[str], used: frozenset[int]) -> str | None:
+        """The first part not naming a division, which might be the street or building number."""
+        return next((p for i, p in enumerate(parts) if p and i not in used), None)
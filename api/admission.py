@@ -0,0 +1,268 @@
+"""
+Admission control: rate limit per client IP, and concurrency limit per kind of expensive request.
+
+Every request costs tokens from the bucket of its client IP, expensive ones cost more.
+The buckets are kept by a `RateLimitBackend`: `LocalBackend` in the worker's memory,
+or `RedisBackend` to share the limits between workers and servers.
+
+Full dumps, address parsing and searches also have a limit of concurrent requests in each worker,
+with a short queue. When the queue is full, requests are rejected right away with 503,
+so that cheap lookups are still served quickly during abuse spikes.
+"""
+
+import asyncio
+import time
+from collections.abc import Callable
+from enum import Enum
+from functools import cache
+from threading import Lock
+from typing import Protocol
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from logbook import Logger
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import settings
+
+
+logger = Logger(__name__)
+
+
+class RouteClass(str, Enum):
+    DUMP = 'dump'
+    PARSE = 'parse'
+    SEARCH = 'search'
+
+
+# Tokens taken from the client's bucket for each kind of request. Other requests cost 1.
+COSTS = {
+    RouteClass.DUMP: 20,
+    RouteClass.PARSE: 2,
+    RouteClass.SEARCH: 2,
+}
+ROOT_PATHS = frozenset(('/api/v1/', '/api/v2/'))
+LIST_PATHS = frozenset(('/api/v1/p/', '/api/v1/d/', '/api/v1/w/', '/api/v2/p/', '/api/v2/w/'))
+# List endpoints whose full listing is large. The province lists are no bigger than `/api/v1/`.
+DUMP_LIST_PATHS = frozenset(('/api/v1/d/', '/api/v1/w/', '/api/v2/w/'))
+
+
+def classify(request: Request) -> RouteClass | None:
+    """Tell which kind of expensive request it is, or None for cheap ones."""
+    path = request.url.path
+    params = request.query_params
+    if path.endswith(('/parse-address', '/parse-address/candidates')):
+        return RouteClass.PARSE
+    if '/search' in path or (path in LIST_PATHS and params.get('search')):
+        return RouteClass.SEARCH
+    if path in ROOT_PATHS and params.get('depth', '1') != '1':
+        return RouteClass.DUMP
+    # Full listings, which are not narrowed down by codes, pagination or parent division
+    narrowed = any(params.get(k) for k in ('codes', 'limit', 'province'))
+    if path in DUMP_LIST_PATHS and request.method == 'GET' and not narrowed:
+        return RouteClass.DUMP
+    return None
+
+
+@cache
+def blacklist() -> frozenset[str]:
+    return frozenset(filter(None, (s.strip() for s in settings.blacklisted_clients.split(','))))
+
+
+def is_blacklisted(request: Request) -> bool:
+    """Whether the client is not allowed to get full dumps. Clients of unknown IP are not allowed either."""
+    client_ip = request.client.host if request.client else None
+    return not client_ip or client_ip in blacklist()
+
+
+class RateLimitBackend(Protocol):
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> bool:
+        """Take `cost` tokens from the bucket `key`, return False if there are not enough tokens."""
+        ...
+
+
+class LocalBackend:
+    """Token buckets in the memory of this worker. Also used as the stand-in for a shared backend in tests."""
+
+    # When there are more buckets than this, the idle ones are dropped.
+    max_keys = 100_000
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        # Key -> (tokens, last update time)
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.lock = Lock()
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> bool:
+        now = self.clock()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.evict(now, rate, burst)
+        return allowed
+
+    def evict(self, now: float, rate: float, burst: float):
+        # Buckets which have been refilled are the same as new ones, no need to keep them.
+        self.buckets = {k: v for k, v in self.buckets.items() if v[0] + (now - v[1]) * rate < burst}
+
+
+# Refill and take tokens atomically in Redis, using the Redis server's clock so that all workers agree.
+REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return allowed
+"""
+
+
+class RedisBackend:
+    """Token buckets in Redis, shared by all workers. Requires the `redis` package."""
+
+    def __init__(self, url: str, prefix: str = 'vn-provinces:rate:'):
+        import redis.asyncio
+
+        self.client = redis.asyncio.from_url(url)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+        self.prefix = prefix
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> bool:
+        try:
+            return bool(await self.script(keys=[self.prefix + key], args=[rate, burst, cost]))
+        except Exception as e:
+            # Better to serve without limit than to fail all requests when Redis is down.
+            logger.warning('Failed to check rate limit in Redis: {}', e)
+            return True
+
+
+class ConcurrencyLimiter:
+    """Allow `limit` requests at the same time, up to `max_queue` more may wait for `timeout` seconds."""
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.waiting = 0
+
+    async def acquire(self) -> bool:
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        except TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        return True
+
+    def release(self):
+        self.semaphore.release()
+
+
+class AdmissionController:
+    def __init__(self, backend: RateLimitBackend, limiters: dict[RouteClass, ConcurrencyLimiter]):
+        self.backend = backend
+        self.limiters = limiters
+
+    async def admit(self, request: Request) -> tuple[Response | None, ConcurrencyLimiter | None]:
+        """
+        Take the tokens and the concurrency slot for the request.
+
+        Return the response rejecting it, if it is, else the limiter whose slot it holds, if any.
+        The slot must be released once the response is sent.
+        """
+        route_class = classify(request)
+        if request.client:
+            cost = self.cost(route_class)
+            if not await self.take(request.client.host, cost):
+                return reject(429, 'too-many-requests', cost / settings.rate_limit), None
+        if route_class is None or route_class not in self.limiters:
+            return None, None
+        limiter = self.limiters[route_class]
+        if not await limiter.acquire():
+            logger.info('Shed {} request {}', route_class.value, request.url.path)
+            return reject(503, 'server-busy', 1), None
+        return None, limiter
+
+    @staticmethod
+    def cost(route_class: RouteClass | None) -> float:
+        # A request costing more than the burst size would never pass
+        return min(COSTS[route_class] if route_class else 1, settings.rate_limit_burst)
+
+    async def take(self, client_ip: str, cost: float) -> bool:
+        """Take tokens from the client's bucket, return False if the client is over the rate limit."""
+        if settings.rate_limit <= 0:
+            return True
+        return await self.backend.take(client_ip, cost, settings.rate_limit, settings.rate_limit_burst)
+
+
+class AdmissionMiddleware:
+    """
+    Apply the admission controller to HTTP requests.
+
+    It is plain ASGI, not `app.middleware('http')`, which gets the response as soon as its headers are sent:
+    the concurrency slot is released only once the whole body is sent, like the file of a full dump.
+    """
+
+    def __init__(self, app: ASGIApp, admission: AdmissionController):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        rejection, limiter = await self.admission.admit(Request(scope))
+        if rejection:
+            await rejection(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if limiter:
+                limiter.release()
+
+
+def reject(status: int, detail: str, retry_after: float) -> Response:
+    headers = {'Retry-After': str(max(1, round(retry_after))), 'Cache-Control': 'no-store'}
+    return JSONResponse({'detail': detail}, status_code=status, headers=headers)
+
+
+def make_backend() -> RateLimitBackend:
+    if settings.rate_limit_redis_url:
+        return RedisBackend(settings.rate_limit_redis_url)
+    return LocalBackend()
+
+
+def make_controller() -> AdmissionController:
+    limits = {
+        RouteClass.DUMP: settings.max_concurrent_dumps,
+        RouteClass.PARSE: settings.max_concurrent_parses,
+        RouteClass.SEARCH: settings.max_concurrent_searches,
+    }
+    limiters = {k: ConcurrencyLimiter(v, settings.max_queue, settings.queue_timeout) for k, v in limits.items()}
+    return AdmissionController(make_backend(), limiters)
+
+
+@cache
+def controller() -> AdmissionController:
+    """The admission controller of this process, shared by `AdmissionMiddleware` and the WebSocket endpoints."""
+    return make_controller()
@@ -0,0 +1,89 @@
+"""
+Other names of divisions, and abbreviations of division types, from a versioned dictionary (`data/aliases.json`).
+
+    {
+        "version": "...",
+        "abbreviations": {"Quận": ["Q."], ...},             # Division type -> its abbreviations
+        "spellings": {"oà": "òa", ...},                     # Old-style tone marks -> the ones in the data
+        "v1": {"provinces": [{"code": 79, "name": "Thành phố Hồ Chí Minh", "aliases": ["HCM", "Sài Gòn"]}], ...},
+        "v2": {...}
+    }
+
+The aliases of each API version are listed by level, with the name of the division, so that an alias is dropped
+rather than given to the wrong division if the codes change in new data.
+They are compiled into the tables of the address parser when the data is loaded (see `snapshot.py` and
+`address.py`), nothing is looked up per request. The keyword searches don't use them: a search for "ha" would
+find the provinces which "Hà Giang" and "Hà Nam" were merged into, ahead of those named so.
+A `DATA_DIR/aliases.json` replaces the bundled dictionary.
+"""
+
+import hashlib
+import json
+import unicodedata
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field, replace
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+from logbook import Logger
+
+from .lookup import DivisionIndex
+
+
+logger = Logger(__name__)
+
+ALIASES_FILENAME = 'aliases.json'
+ALIASES_PATH = Path(__file__).parent / 'data' / ALIASES_FILENAME
+
+
+# Compared by the digest of their file, so that the data built with them can be cached by their content
+@dataclass(frozen=True)
+class Aliases:
+    version: str = ''
+    abbreviations: Mapping[str, Sequence[str]] = field(default_factory=dict, compare=False)
+    spellings: Mapping[str, str] = field(default_factory=dict, compare=False)
+    # API version -> level, like "provinces" -> entries with "code", "name" and "aliases"
+    entries: Mapping[str, Mapping[str, Sequence[dict[str, Any]]]] = field(default_factory=dict, compare=False)
+    # SHA-256 of the file
+    digest: str = ''
+
+    def of(self, api_version: str, level: str, index: DivisionIndex) -> dict[int, tuple[str, ...]]:
+        """Get the aliases of the divisions of `index` by code, skipping those whose name doesn't match."""
+        found = {}
+        for entry in self.entries.get(api_version, {}).get(level, ()):
+            code = int(entry['code'])
+            obj = index.get(code)
+            if obj is None or unicodedata.normalize('NFC', obj.name) != unicodedata.normalize('NFC', entry['name']):
+                logger.warning(
+                    'Aliases {} of {} {} ({}) do not match the data', self.version, level, code, entry['name']
+                )
+                continue
+            found[code] = tuple(entry['aliases'])
+        return found
+
+    def apply(self, api_version: str, level: str, index: DivisionIndex) -> DivisionIndex:
+        """Give the index the aliases of its divisions. To do before `warm()`, which uses them."""
+        return replace(index, aliases=self.of(api_version, level, index))
+
+
+def read_aliases(path: Path) -> Aliases:
+    content = path.read_bytes()
+    data = json.loads(content)
+    return Aliases(
+        str(data['version']),
+        data.get('abbreviations', {}),
+        data.get('spellings', {}),
+        {k: data[k] for k in ('v1', 'v2') if k in data},
+        hashlib.sha256(content).hexdigest(),
+    )
+
+
+@cache
+def load_bundled_aliases() -> Aliases:
+    return read_aliases(ALIASES_PATH)
+
+
+def load_aliases(data_dir: Path | None) -> Aliases:
+    path = data_dir / ALIASES_FILENAME if data_dir else None
+    return read_aliases(path) if path and path.is_file() else load_bundled_aliases()
@@ -0,0 +1,226 @@
+"""
+Benchmark the throughput and memory of the server against its number of workers, on this machine.
+
+    python -m api.bench_workers --workers 1,2,4 --duration 10
+    python -m api.bench_workers --server uvicorn    # `uvicorn --workers`, each worker loading the data on its own
+
+For each number of workers, the server is started on a free port, and once it responds, gets a mix of lookups,
+searches and address parsing (`PATHS`) from `--clients` processes, each keeping `--connections` connections busy,
+for `--duration` seconds. The rate limit and load shedding are turned off for the server.
+The clients run on the same machine and take CPU from the server: compare the runs with each other,
+not with a server on its own machine.
+
+Memory is the total of the server processes, after the load. RSS counts the pages shared by the processes
+once per process, PSS splits them between the processes sharing them. Both are read from /proc, Linux only.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import quote
+
+
+PATHS = (
+    '/api/v2/w/4',
+    '/api/v2/p/1',
+    '/api/v1/w/1',
+    '/api/v1/d/1',
+    '/api/v2/w/?province=1&limit=20',
+    '/api/v2/search/wards?q=phuc xa',
+    '/api/v2/search/provinces?q=ha',
+    '/api/v1/search/?q=phuc xa',
+    '/api/v1/w/search/?q=hang bac',
+    '/api/v2/parse-address?address=12 Lê Lợi, P. Bến Thành, Q.1, TP.HCM',
+    '/api/v1/parse-address?address=Phường Phúc Xá, Quận Ba Đình, Hà Nội',
+)
+SERVER_ENV = {'RATE_LIMIT': '0', 'MAX_QUEUE': '100000', 'QUEUE_TIMEOUT': '60'}
+READY_TIMEOUT = 180
+
+
+@dataclass
+class ClientStats:
+    requests: int = 0
+    errors: int = 0
+    # In seconds
+    latencies: list[float] = field(default_factory=list)
+
+
+def server_command(server: str, workers: int, port: int) -> list[str]:
+    if server == 'serve':
+        return [sys.executable, '-m', 'api.serve', '--workers', str(workers), '--port', str(port)]
+    return [sys.executable, '-m', 'uvicorn', 'api.main:app', '--workers', str(workers), '--port', str(port)]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, process: subprocess.Popen) -> float:
+    """Wait for the server to respond, return how long it took."""
+    started = time.monotonic()
+    while time.monotonic() - started < READY_TIMEOUT:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with status {process.returncode}')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/v2/version', timeout=1):
+                return time.monotonic() - started
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Server not ready')
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    """Read one HTTP/1.1 response, return its status."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = False
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if not chunked:
+        await reader.readexactly(length)
+        return status
+    while size := int((await reader.readline()).split(b';')[0], 16):
+        await reader.readexactly(size + 2)
+    await reader.readline()
+    return status
+
+
+async def run_connection(port: int, offset: int, deadline: float, stats: ClientStats):
+    requests = [f'GET {quote(p, safe="/?=&,")} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode() for p in PATHS]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    i = offset
+    try:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            writer.write(requests[i % len(requests)])
+            status = await read_response(reader)
+            stats.latencies.append(time.perf_counter() - start)
+            stats.requests += 1
+            stats.errors += status != 200
+            i += 1
+    finally:
+        writer.close()
+
+
+def run_client(port: int, connections: int, duration: float, index: int) -> ClientStats:
+    stats = ClientStats()
+    deadline = time.monotonic() + duration
+
+    async def run():
+        await asyncio.gather(*(run_connection(port, index + i, deadline, stats) for i in range(connections)))
+
+    asyncio.run(run())
+    return stats
+
+
+def descendants(pid: int) -> list[int]:
+    children: dict[int, list[int]] = {}
+    for stat in Path('/proc').glob('[0-9]*/stat'):
+        try:
+            # The command may have spaces, the fields after it don't.
+            fields = stat.read_text().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    found = [pid]
+    for p in found:
+        found.extend(children.get(p, ()))
+    return found
+
+
+def read_kb(path: str, key: str) -> int:
+    try:
+        for line in Path(path).read_text().splitlines():
+            if line.startswith(key):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def memory_mb(pid: int) -> tuple[float, float]:
+    """Total RSS and PSS of the process and its descendants, in MB."""
+    pids = descendants(pid)
+    rss = sum(read_kb(f'/proc/{p}/status', 'VmRSS:') for p in pids)
+    pss = sum(read_kb(f'/proc/{p}/smaps_rollup', 'Pss:') for p in pids)
+    return rss / 1024, pss / 1024
+
+
+def bench(server: str, workers: int, clients: int, connections: int, duration: float) -> dict[str, float]:
+    port = free_port()
+    env = {**os.environ, **SERVER_ENV}
+    process = subprocess.Popen(
+        server_command(server, workers, port), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        startup = wait_ready(port, process)
+        # Let all workers start, uvicorn only waits for the first one
+        time.sleep(1)
+        idle_rss, idle_pss = memory_mb(process.pid)
+        with ProcessPoolExecutor(clients) as pool:
+            futures = [pool.submit(run_client, port, connections, duration, i * connections) for i in range(clients)]
+            results = [f.result() for f in futures]
+        rss, pss = memory_mb(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    latencies = sorted(t for r in results for t in r.latencies)
+    requests = sum(r.requests for r in results)
+    return {
+        'workers': workers,
+        'startup_s': startup,
+        'rps': requests / duration,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        'errors': sum(r.errors for r in results),
+        'idle_pss_mb': idle_pss,
+        'rss_mb': rss,
+        'pss_mb': pss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure throughput and memory of the server per number of workers.')
+    parser.add_argument('--server', choices=('serve', 'uvicorn'), default='serve')
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated numbers of workers to try')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load for each number of workers')
+    parser.add_argument('--clients', type=int, default=2, help='Number of client processes')
+    parser.add_argument('--connections', type=int, default=16, help='Connections per client process')
+    args = parser.parse_args()
+    print(
+        f'{"workers":>7} {"startup s":>9} {"req/s":>8} {"p50 ms":>7} {"p99 ms":>7} {"errors":>6} '
+        f'{"idle PSS MB":>11} {"RSS MB":>7} {"PSS MB":>7}'
+    )
+    for workers in (int(w) for w in args.workers.split(',')):
+        r = bench(args.server, workers, args.clients, args.connections, args.duration)
+        print(
+            f'{r["workers"]:>7} {r["startup_s"]:>9.1f} {r["rps"]:>8.0f} {r["p50_ms"]:>7.1f} {r["p99_ms"]:>7.1f} '
+            f'{r["errors"]:>6} {r["idle_pss_mb"]:>11.0f} {r["rss_mb"]:>7.0f} {r["pss_mb"]:>7.0f}',
+            flush=True,
+        )
+
+
+if __name__ == '__main__':
+    main()
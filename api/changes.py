@@ -0,0 +1,117 @@
+"""
+Compute what changed in the v2 division data between an older data version and the current one.
+
+The app only has the current data, so older versions are kept as snapshots in `api/data/snapshots/`.
+After bumping the `vietnam_provinces` dependency, or updating the data in `DATA_DIR`,
+save a snapshot of the new data with:
+
+    python -m api.changes [DATA_DIR]
+
+so that clients can later sync from this version.
+"""
+
+import argparse
+import gzip
+import json
+import re
+from dataclasses import asdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from logbook import Logger
+from logbook.more import ColorizedStderrHandler
+
+from .lookup import render
+from .snapshot import Snapshot, V2Data, current
+
+
+logger = Logger(__name__)
+
+SNAPSHOT_DIR = Path(__file__).parent / 'data' / 'snapshots'
+DATA_VERSION_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+class UnknownDataVersionError(LookupError):
+    pass
+
+
+def take_snapshot(data: V2Data) -> dict[str, Any]:
+    return {
+        'data_version': data.data_version,
+        'provinces': [asdict(p) for p in data.provinces.iter_records(data.provinces.codes)],
+        'wards': [asdict(w) for w in data.wards.iter_records(data.wards.codes)],
+    }
+
+
+def snapshot_path(data_version: str) -> Path:
+    return SNAPSHOT_DIR / f'{data_version}.json.gz'
+
+
+def load_snapshot(data_version: str) -> dict[str, Any]:
+    # Checking the format also keeps the user input from escaping the snapshot folder.
+    if not DATA_VERSION_PATTERN.fullmatch(data_version):
+        raise UnknownDataVersionError(data_version)
+    try:
+        content = snapshot_path(data_version).read_bytes()
+    except FileNotFoundError as e:
+        raise UnknownDataVersionError(data_version) from e
+    return json.loads(gzip.decompress(content))
+
+
+def save_snapshot(data: V2Data) -> Path:
+    path = snapshot_path(data.data_version)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # mtime=0 to make the file reproducible
+    path.write_bytes(gzip.compress(render(take_snapshot(data)), 9, mtime=0))
+    return path
+
+
+def diff_records(old: list[dict[str, Any]], new: list[dict[str, Any]]) -> dict[str, Any]:
+    old_by_code = {r['code']: r for r in old}
+    new_by_code = {r['code']: r for r in new}
+    return {
+        'added': [r for c, r in new_by_code.items() if c not in old_by_code],
+        'removed': [c for c in old_by_code if c not in new_by_code],
+        # Renamed divisions, or those moved to another province, with their current data
+        'changed': [r for c, r in new_by_code.items() if c in old_by_code and old_by_code[c] != r],
+    }
+
+
+@lru_cache(maxsize=32)
+def compute_changes(since: str, data_version: str) -> bytes:
+    """
+    Get the changes from `since` to `data_version` (which must be the one in use), rendered to JSON.
+
+    Raise UnknownDataVersionError if there is no snapshot for `since`.
+    The result is cached, so each pair of versions is only computed once.
+    """
+    data = current().v2
+    if data.data_version != data_version:
+        raise UnknownDataVersionError(data_version)
+    # Failures are not cached: `since` is checked before walking all divisions, so that unknown versions cost little.
+    old = None if since == data_version else load_snapshot(since)
+    new = take_snapshot(data)
+    old = old or new
+    logger.info('Computed changes from data version {} to {}', since, data_version)
+    return render(
+        {
+            'since': since,
+            'data_version': data_version,
+            'provinces': diff_records(old['provinces'], new['provinces']),
+            'wards': diff_records(old['wards'], new['wards']),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Save a snapshot of the v2 data, to compute changes from it later.')
+    parser.add_argument('data_dir', type=Path, nargs='?', help='Data folder to take it from, default: bundled data')
+    args = parser.parse_args()
+    ColorizedStderrHandler().push_application()
+    snapshot = Snapshot(args.data_dir) if args.data_dir else current()
+    logger.info('Saved snapshot of data version {} to {}', snapshot.v2.data_version, save_snapshot(snapshot.v2))
+
+
+if __name__ == '__main__':
+    main()
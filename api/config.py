@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from pydantic_settings import BaseSettings
+
+
+class Settings(BaseSettings):
+    tracking: bool = False
+    cdn_cache_interval: int = 30
+    # Folder to load division data from, instead of the bundled data. See `snapshot.py`.
+    data_dir: Path | None = None
+    # How often to check the data folder for changes, in seconds
+    data_poll_interval: float = 60
+    # Comma-separated IPs which are not allowed to get the full dumps
+    blacklisted_clients: str = ''
+    # Token bucket per client IP: requests per second, and how many can be made in a burst. 0 to disable.
+    rate_limit: float = 0
+    rate_limit_burst: float = 100
+    # If set, the rate limit state is kept in Redis, to be shared by all workers
+    rate_limit_redis_url: str | None = None
+    # Maximum number of requests of each expensive kind processed at the same time, per worker.
+    # More requests can wait for a while in a queue, beyond that, they are rejected.
+    max_concurrent_dumps: int = 4
+    max_concurrent_parses: int = 16
+    max_concurrent_searches: int = 16
+    max_queue: int = 32
+    queue_timeout: float = 2
+
+
+settings = Settings()
@@ -0,0 +1,32 @@
+"""
+Division lookup, search and address parsing without the HTTP layer, for Python services to use in-process.
+
+    from api.core import v2
+
+    v2.get_ward(4)
+    v2.search_wards('phuc xa', province_code=1)
+    v2.parse_address('Phường Ba Đình, Hà Nội')
+
+`api.core.v1` has the same for the old 3-level data. The HTTP apps in `api.v1` and `api.v2` are thin wrappers
+over these functions.
+
+Import-time budget: importing `api.core` must take less than 150 ms, and must not import FastAPI, pydantic or lunr.
+Check it with `just core-import-time`. No data is loaded at import: each API version is loaded on first use
+(about 0.3 s for v2, 0.7 s for v1), the v1 search index is built on the first v1 search (about 1.3 s),
+and the tables of the address parser on the first parse (about 0.1 s for v1).
+Call `warm()` to pay for all of that upfront.
+
+The functions use the data in use by `api.snapshot`, so they follow its hot reloading.
+Pass `data` to make several calls on the same data.
+"""
+
+from ..snapshot import current
+from . import v1, v2
+
+
+__all__ = ('v1', 'v2', 'warm')
+
+
+def warm():
+    """Load the data of both API versions and build the search index now, instead of on first use."""
+    current().warm()
@@ -0,0 +1,147 @@
+"""Lookup, search and address parsing on the old data (before 2025-07-01), which has 3 levels."""
+
+from collections.abc import Sequence
+from dataclasses import dataclass, fields
+from itertools import chain
+
+from ..address import AddressMatch
+from ..search import DivisionLevel, IncrementalSearch, PathHit, SearchHit
+from ..snapshot import V1Data, current
+from ..vendor.vietnam_provinces.base import District, Province, Ward
+
+
+@dataclass
+class ParsedAddress:
+    province: str | None = None
+    province_code: int | None = None
+    district: str | None = None
+    district_code: int | None = None
+    ward: str | None = None
+    ward_code: int | None = None
+    street: str | None = None
+
+
+@dataclass
+class AddressCandidate(ParsedAddress):
+    # From 0 to 1, how well the parts of the address match the names of the divisions
+    confidence: float = 0.0
+
+
+def get_province(code: int, data: V1Data | None = None) -> Province | None:
+    return (data or current().v1).provinces.get(code)
+
+
+def get_district(code: int, data: V1Data | None = None) -> District | None:
+    return (data or current().v1).districts.get(code)
+
+
+def get_ward(code: int, data: V1Data | None = None) -> Ward | None:
+    return (data or current().v1).wards.get(code)
+
+
+def get_districts_of(province_code: int, data: V1Data | None = None) -> list[District]:
+    data = data or current().v1
+    return list(data.districts.iter_records(data.districts.children.get(province_code, ())))
+
+
+def get_wards_of(district_code: int, data: V1Data | None = None) -> list[Ward]:
+    data = data or current().v1
+    return list(data.wards.iter_records(data.wards.children.get(district_code, ())))
+
+
+# The searches follow lunr query syntax, and raise InvalidQueryError if the query is malformed.
+
+
+def search_provinces(query: str, data: V1Data | None = None) -> tuple[SearchHit, ...]:
+    return (data or current().v1).searcher.search_province(query)
+
+
+def search_districts(query: str, province_code: int | None = None, data: V1Data | None = None) -> tuple[SearchHit, ...]:
+    return (data or current().v1).searcher.search_district(query, province_code)
+
+
+def search_wards(
+    query: str, district_code: int | None = None, province_code: int | None = None, data: V1Data | None = None
+) -> tuple[SearchHit, ...]:
+    return (data or current().v1).searcher.search_ward(query, district_code, province_code)
+
+
+def search(query: str, province_code: int | None = None, limit: int = 20, data: V1Data | None = None) -> list[PathHit]:
+    """Search provinces, districts and wards at once, ranked by relevance, with their parent divisions."""
+    return (data or current().v1).searcher.search_all(query, province_code, limit)
+
+
+def search_session(
+    level: DivisionLevel = DivisionLevel.W,
+    district_code: int | None = None,
+    province_code: int | None = None,
+    data: V1Data | None = None,
+) -> IncrementalSearch:
+    """
+    Start a type-ahead search on the divisions of `level`, optionally within a province or district.
+
+    Unlike the other searches, the queries are plain keywords, matched anywhere in the names with accents ignored.
+    Each query given to its `search()` is refined from the previous ones when possible.
+    """
+    data = data or current().v1
+    if level == DivisionLevel.P:
+        return IncrementalSearch(data.provinces.folded_names, data.provinces.order)
+    district_codes = data.districts.children.get(province_code, ()) if province_code else None
+    if level == DivisionLevel.D:
+        return IncrementalSearch(
+            data.districts.folded_names, data.districts.order if district_codes is None else district_codes
+        )
+    wards = data.wards
+    if district_code:
+        codes: Sequence[int] = wards.children.get(district_code, ())
+    elif district_codes is not None:
+        codes = tuple(chain.from_iterable(wards.children.get(d, ()) for d in district_codes))
+    else:
+        codes = wards.order
+    return IncrementalSearch(wards.folded_names, codes)
+
+
+def make_candidate(match: AddressMatch, data: V1Data) -> AddressCandidate:
+    province, district, ward = (
+        index.records[code] if code is not None else None
+        for index, code in zip((data.provinces, data.districts, data.wards), match.codes)
+    )
+    return AddressCandidate(
+        province=province.name if province else None,
+        province_code=province.code if province else None,
+        district=district.name if district else None,
+        district_code=district.code if district else None,
+        ward=ward.name if ward else None,
+        ward_code=ward.code if ward else None,
+        street=match.street,
+        confidence=match.confidence,
+    )
+
+
+def parse_address_candidates(address: str, k: int = 5, data: V1Data | None = None) -> list[AddressCandidate]:
+    """
+    Find up to `k` combinations of province, district and ward that the address may name, the most likely first.
+
+    The divisions of each combination are consistent with each other. Levels missing from the address are
+    filled in from the lower levels found, like the district of a ward.
+    If nothing is found, the only candidate has no division, and a confidence of 0.
+    """
+    data = data or current().v1
+    return [make_candidate(match, data) for match in data.matcher.match(address, k)]
+
+
+def parse_address(address: str, data: V1Data | None = None) -> ParsedAddress:
+    """
+    Parse Vietnamese address string into structured components: the best of `parse_address_candidates`.
+
+    The divisions are only filled in if the best candidate is good enough and clearly ahead of the others,
+    else the address is taken as the street.
+
+    Example inputs:
+    - "456 haha, Xã Quang Trọng, Huyện Thạch An, Tỉnh Cao Bằng"
+    - "Tỉnh Cao Bằng"
+    - "Huyện Thạch An, Cao Bằng"
+    """
+    data = data or current().v1
+    best = make_candidate(data.matcher.best(address), data)
+    return ParsedAddress(**{f.name: getattr(best, f.name) for f in fields(ParsedAddress)})
@@ -0,0 +1,118 @@
+"""Lookup, search and address parsing on the current (2025) data, which has 2 levels: province and ward."""
+
+from dataclasses import dataclass, fields
+from itertools import islice
+from typing import TYPE_CHECKING, Literal
+
+from ..address import AddressMatch
+from ..search import IncrementalSearch, fold_keywords, match_keywords
+from ..snapshot import V2Data, current
+
+
+if TYPE_CHECKING:
+    from vietnam_provinces import Province, Ward
+
+
+@dataclass
+class ParsedAddress:
+    province: str | None = None
+    province_code: int | None = None
+    ward: str | None = None
+    ward_code: int | None = None
+    street: str | None = None
+
+
+@dataclass
+class AddressCandidate(ParsedAddress):
+    # From 0 to 1, how well the parts of the address match the names of the divisions
+    confidence: float = 0.0
+
+
+def get_province(code: int, data: V2Data | None = None) -> 'Province | None':
+    return (data or current().v2).provinces.get(code)
+
+
+def get_ward(code: int, data: V2Data | None = None) -> 'Ward | None':
+    return (data or current().v2).wards.get(code)
+
+
+def get_wards_of(province_code: int, data: V2Data | None = None) -> list['Ward']:
+    data = data or current().v2
+    return list(data.wards.iter_records(data.wards.children.get(province_code, ())))
+
+
+def search_provinces(query: str, limit: int | None = None, data: V2Data | None = None) -> list['Province']:
+    """Find the provinces whose name contains all words of the query, accents ignored. Sorted by code."""
+    data = data or current().v2
+    index = data.provinces
+    codes = match_keywords(index.folded_names, index.codes, fold_keywords(query))
+    return list(index.iter_records(islice(codes, limit)))
+
+
+def search_wards(
+    query: str, province_code: int = 0, limit: int | None = None, data: V2Data | None = None
+) -> list['Ward']:
+    """Find the wards whose name contains all words of the query, accents ignored, in one province if given."""
+    data = data or current().v2
+    index = data.wards
+    candidates = index.children.get(province_code, ()) if province_code else index.order
+    codes = match_keywords(index.folded_names, candidates, fold_keywords(query))
+    return list(index.iter_records(islice(codes, limit)))
+
+
+def search_session(
+    kind: Literal['provinces', 'wards'] = 'wards', province_code: int = 0, data: V2Data | None = None
+) -> IncrementalSearch:
+    """
+    Start a type-ahead search, with the same matching as `search_provinces` and `search_wards`.
+
+    Each query given to its `search()` is refined from the previous ones when possible.
+    """
+    data = data or current().v2
+    if kind == 'provinces':
+        return IncrementalSearch(data.provinces.folded_names, data.provinces.codes)
+    index = data.wards
+    return IncrementalSearch(
+        index.folded_names, index.children.get(province_code, ()) if province_code else index.order
+    )
+
+
+def make_candidate(match: AddressMatch, data: V2Data) -> AddressCandidate:
+    province_code, ward_code = match.codes
+    province = data.provinces.records[province_code] if province_code is not None else None
+    ward = data.wards.records[ward_code] if ward_code is not None else None
+    return AddressCandidate(
+        province=province.name if province else None,
+        province_code=province.code if province else None,
+        ward=ward.name if ward else None,
+        ward_code=ward.code if ward else None,
+        street=match.street,
+        confidence=match.confidence,
+    )
+
+
+def parse_address_candidates(address: str, k: int = 5, data: V2Data | None = None) -> list[AddressCandidate]:
+    """
+    Find up to `k` combinations of province and ward that the address may name, the most likely first.
+
+    If the province is missing from the address, it is the province of the ward.
+    If nothing is found, the only candidate has no division, and a confidence of 0.
+    """
+    data = data or current().v2
+    return [make_candidate(match, data) for match in data.matcher.match(address, k)]
+
+
+def parse_address(address: str, data: V2Data | None = None) -> ParsedAddress:
+    """
+    Parse Vietnamese address string into structured components (Province -> Ward only):
+    the best of `parse_address_candidates`, if it is good enough and clearly ahead of the others,
+    else the address is taken as the street.
+
+    Example inputs:
+    - "456 haha, Xã Quang Trọng, Tỉnh Cao Bằng"
+    - "Tỉnh Cao Bằng"
+    - "Xã Quang Trọng, Cao Bằng"
+    """
+    data = data or current().v2
+    best = make_candidate(data.matcher.best(address), data)
+    return ParsedAddress(**{f.name: getattr(best, f.name) for f in fields(ParsedAddress)})
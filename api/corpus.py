@@ -0,0 +1,188 @@
+"""
+Generate realistic address strings and search queries from the division data, to check and benchmark
+the address parser and the searches (see `differential.py`).
+
+Each address is built from a random ward and its parents, then varied the way people type addresses:
+other names from the alias dictionary ("Sài Gòn", see `aliases.py`), full, abbreviated or missing prefixes
+("Thành phố", "TP.", ""), missing accents, different case, parts in reverse order, missing levels, street noise,
+other separators and decomposed Unicode. It also keeps the codes it was built from, to measure accuracy.
+
+    python -m api.corpus v2 --size 1000 --seed 1 > addresses.jsonl
+"""
+
+import argparse
+import json
+import sys
+import unicodedata
+from collections.abc import Iterator, Sequence
+from dataclasses import asdict, dataclass
+from itertools import islice
+from random import Random
+
+from unidecode import unidecode
+
+from .snapshot import current
+
+
+# Division type prefixes of the names, and the ways they are abbreviated
+ABBREVIATIONS = {
+    'Thành phố': ('TP.', 'TP', 'Tp.', 'T.P'),
+    'Tỉnh': ('T.',),
+    'Quận': ('Q.', 'Q'),
+    'Huyện': ('H.',),
+    'Thị xã': ('TX.', 'TX', 'Tx.'),
+    'Thị trấn': ('TT.', 'TT'),
+    'Phường': ('P.', 'P'),
+    'Xã': ('X.',),
+    'Đặc khu': ('ĐK.',),
+}
+STREETS = ('Lê Lợi', 'Trần Hưng Đạo', 'Nguyễn Trãi', 'Hai Bà Trưng', 'Lý Thường Kiệt', 'Quốc lộ 1A', 'Đường 3/2')
+SEPARATORS = (', ', ',', ' , ', ' - ', '; ')
+
+
+@dataclass
+class AddressSample:
+    text: str
+    province_code: int
+    ward_code: int
+    # Only for v1
+    district_code: int | None = None
+
+
+def split_prefix(name: str) -> tuple[str, str]:
+    """Split "Phường Phúc Xá" into ("Phường", "Phúc Xá"). The prefix is empty if unknown."""
+    name = unicodedata.normalize('NFC', name)
+    for prefix in ABBREVIATIONS:
+        if name.startswith(prefix + ' '):
+            return prefix, name[len(prefix) + 1 :]
+    return '', name
+
+
+def vary_name(name: str, rng: Random, aliases: Sequence[str] = ()) -> str:
+    if aliases and rng.random() < 0.3:
+        name = rng.choice(aliases)
+    prefix, bare = split_prefix(name)
+    roll = rng.random()
+    if not prefix or roll < 0.4:
+        text = name
+    elif roll < 0.65:
+        text = bare
+    else:
+        abbr = rng.choice(ABBREVIATIONS[prefix])
+        # Like "Q.1" or "P. 12"
+        glue = '' if bare.isdigit() and rng.random() < 0.5 else ' '
+        text = abbr + glue + bare
+    roll = rng.random()
+    if roll < 0.25:
+        text = unidecode(text)
+    elif roll < 0.35:
+        text = text.lower()
+    elif roll < 0.4:
+        text = text.upper()
+    return text
+
+
+def make_street(rng: Random) -> str:
+    street = rng.choice(STREETS)
+    roll = rng.random()
+    if roll < 0.4:
+        return f'{rng.randint(1, 999)} {street}'
+    if roll < 0.6:
+        return f'Số {rng.randint(1, 200)} ngõ {rng.randint(1, 99)} {street}'
+    if roll < 0.75:
+        return f'Tổ {rng.randint(1, 30)}'
+    return street
+
+
+def assemble(parts: list[str], rng: Random) -> str:
+    if rng.random() < 0.15:
+        parts = parts[::-1]
+    text = rng.choice(SEPARATORS).join(parts)
+    roll = rng.random()
+    if roll < 0.05:
+        text = unicodedata.normalize('NFD', text)
+    elif roll < 0.1:
+        text = '  ' + text.replace(' ', '  ', 1) + ' '
+    return text
+
+
+def generate_addresses_v1(size: int, seed: int = 0) -> Iterator[AddressSample]:
+    data = current().v1
+    rng = Random(seed)
+    codes = data.wards.codes
+    for _ in range(size):
+        ward = data.wards.records[rng.choice(codes)]
+        district = data.districts.records[ward.district_code]
+        province = data.provinces.records[district.province_code]
+        parts = [
+            vary_name(ward.name, rng, data.wards.aliases.get(ward.code, ())),
+            vary_name(district.name, rng, data.districts.aliases.get(district.code, ())),
+            vary_name(province.name, rng, data.provinces.aliases.get(province.code, ())),
+        ]
+        roll = rng.random()
+        # Some addresses miss a level
+        if roll < 0.1:
+            del parts[0]
+        elif roll < 0.2:
+            del parts[1]
+        if rng.random() < 0.6:
+            parts.insert(0, make_street(rng))
+        yield AddressSample(assemble(parts, rng), province.code, ward.code, district.code)
+
+
+def generate_addresses_v2(size: int, seed: int = 0) -> Iterator[AddressSample]:
+    data = current().v2
+    rng = Random(seed)
+    codes = data.wards.codes
+    for _ in range(size):
+        ward = data.wards.records[rng.choice(codes)]
+        province = data.provinces.records[int(ward.province_code)]
+        parts = [
+            vary_name(ward.name, rng, data.wards.aliases.get(int(ward.code), ())),
+            vary_name(province.name, rng, data.provinces.aliases.get(int(province.code), ())),
+        ]
+        if rng.random() < 0.1:
+            del parts[0]
+        if rng.random() < 0.6:
+            parts.insert(0, make_street(rng))
+        yield AddressSample(assemble(parts, rng), int(province.code), int(ward.code))
+
+
+def generate_queries(version: str, size: int, seed: int = 0) -> Iterator[str]:
+    """
+    Search queries like users type them: one or two words from a ward name, with or without accents.
+    Some queries come after their prefixes, like a type-ahead client sends them.
+    """
+    return islice(iter_queries(version, seed), size)
+
+
+def iter_queries(version: str, seed: int) -> Iterator[str]:
+    data = current().v1 if version == 'v1' else current().v2
+    rng = Random(seed)
+    codes = data.wards.codes
+    while True:
+        _prefix, bare = split_prefix(data.wards.records[rng.choice(codes)].name)
+        words = bare.split()
+        start = rng.randrange(len(words))
+        query = ' '.join(words[start : start + rng.randint(1, 2)])
+        if rng.random() < 0.5:
+            query = unidecode(query).lower()
+        if rng.random() < 0.2:
+            for i in range(1, len(query)):
+                yield query[:i]
+        yield query
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate addresses from the division data, as JSON lines.')
+    parser.add_argument('version', choices=('v1', 'v2'))
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate = generate_addresses_v1 if args.version == 'v1' else generate_addresses_v2
+    for sample in generate(args.size, args.seed):
+        sys.stdout.write(json.dumps(asdict(sample), ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
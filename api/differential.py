@@ -0,0 +1,196 @@
+"""
+Run the reference implementations (`reference.py`) and the ones in use side by side on generated inputs
+(`corpus.py`), report where their outputs differ, and how much faster the ones in use are.
+
+    python -m api.differential                  # All checks
+    python -m api.differential parse-v2 --size 5000 --show 10
+
+For address parsing, it also reports how often each implementation finds the ward the address was built from.
+The address parsers in use rank candidates by score (see `address.py`), so their outputs are expected to differ
+from the reference: for them, the check fails only if they find fewer wards. The other checks fail if any output
+differs. Exit with status 1 if any check fails.
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import asdict, dataclass, field, is_dataclass
+from typing import Any
+
+from lunr.exceptions import QueryParseError
+
+from . import reference
+from .core import v1 as core_v1
+from .core import v2 as core_v2
+from .corpus import AddressSample, generate_addresses_v1, generate_addresses_v2, generate_queries
+from .lookup import render
+from .search import DivisionLevel
+from .snapshot import current
+
+
+@dataclass
+class Check:
+    name: str
+    # Size, seed -> inputs
+    make_inputs: Callable[[int, int], Iterable[Any]]
+    reference: Callable[[Any], Any]
+    candidate: Callable[[Any], Any]
+    # Whether an output found what the input was built from
+    is_correct: Callable[[Any, Any], bool] | None = None
+    # Whether the outputs must be the same, else the candidate must be at least as correct
+    exact: bool = True
+
+
+@dataclass
+class Report:
+    name: str
+    size: int = 0
+    reference_ns: int = 0
+    candidate_ns: int = 0
+    reference_correct: int = 0
+    candidate_correct: int = 0
+    # (input, reference output, candidate output)
+    mismatches: list[tuple[Any, Any, Any]] = field(default_factory=list)
+
+
+def normalize(output: Any) -> Any:
+    """Make outputs of different types comparable, like a dataclass and a dict, an IntEnum and an int."""
+    if is_dataclass(output) and not isinstance(output, type):
+        output = asdict(output)
+    elif isinstance(output, tuple | list):
+        output = [asdict(o) if is_dataclass(o) and not isinstance(o, type) else o for o in output]
+    return json.loads(render(output))
+
+
+def call(func: Callable[[Any], Any], arg: Any) -> tuple[Any, int]:
+    start = time.perf_counter_ns()
+    try:
+        output = func(arg)
+    except (ValueError, QueryParseError) as e:
+        # Implementations may raise different error types, like lunr's for the reference v1 search,
+        # only the fact that it fails matters.
+        output = f'error: {e}'
+    elapsed = time.perf_counter_ns() - start
+    return normalize(output), elapsed
+
+
+def run(check: Check, size: int, seed: int) -> Report:
+    report = Report(check.name)
+    for item in check.make_inputs(size, seed):
+        arg = item.text if isinstance(item, AddressSample) else item
+        expected, reference_ns = call(check.reference, arg)
+        got, candidate_ns = call(check.candidate, arg)
+        report.size += 1
+        report.reference_ns += reference_ns
+        report.candidate_ns += candidate_ns
+        if got != expected:
+            report.mismatches.append((arg, expected, got))
+        if check.is_correct:
+            report.reference_correct += check.is_correct(item, expected)
+            report.candidate_correct += check.is_correct(item, got)
+    return report
+
+
+def found_ward(sample: AddressSample, output: dict[str, Any]) -> bool:
+    return output.get('ward_code') == sample.ward_code
+
+
+def make_checks() -> list[Check]:
+    snapshot = current()
+    v1, v2 = snapshot.v1, snapshot.v2
+    session = core_v2.search_session(data=v2)
+
+    def ward_codes(wards) -> list[int]:
+        return [int(w.code) for w in wards]
+
+    return [
+        Check(
+            'parse-v1',
+            generate_addresses_v1,
+            lambda text: reference.parse_address_v1(text, v1),
+            lambda text: core_v1.parse_address(text, v1),
+            found_ward,
+            exact=False,
+        ),
+        Check(
+            'parse-v2',
+            generate_addresses_v2,
+            lambda text: reference.parse_address_v2(text, v2),
+            lambda text: core_v2.parse_address(text, v2),
+            found_ward,
+            exact=False,
+        ),
+        Check(
+            'search-v2-wards',
+            lambda size, seed: generate_queries('v2', size, seed),
+            lambda q: reference.search_wards_v2(q, v2),
+            lambda q: ward_codes(core_v2.search_wards(q, data=v2)),
+        ),
+        Check(
+            # One session for all queries, like a type-ahead client
+            'session-v2-wards',
+            lambda size, seed: generate_queries('v2', size, seed),
+            lambda q: reference.search_wards_v2(q, v2),
+            lambda q: list(session.search(q)),
+        ),
+        Check(
+            'search-v1-wards',
+            lambda size, seed: generate_queries('v1', size, seed),
+            lambda q: reference.search_v1(q, v1, DivisionLevel.W),
+            lambda q: core_v1.search_wards(q, data=v1),
+        ),
+    ]
+
+
+def has_failed(check: Check, report: Report) -> bool:
+    if check.exact:
+        return bool(report.mismatches)
+    return report.candidate_correct < report.reference_correct
+
+
+def print_report(check: Check, report: Report, show: int):
+    speedup = report.reference_ns / report.candidate_ns if report.candidate_ns else float('inf')
+    label = 'mismatches' if check.exact else 'differences'
+    print(
+        f'{report.name:<18} {report.size:>6} inputs {len(report.mismatches):>6} {label:<11} '
+        f'reference {report.reference_ns / 1e6:>9.1f} ms  candidate {report.candidate_ns / 1e6:>9.1f} ms  '
+        f'x{speedup:.2f}'
+    )
+    if check.is_correct and report.size:
+        print(
+            f'{"":<18} ward found: reference {report.reference_correct / report.size:.1%}, '
+            f'candidate {report.candidate_correct / report.size:.1%}'
+        )
+    for arg, expected, got in report.mismatches[:show]:
+        print(f'  input:     {arg!r}')
+        print(f'  reference: {json.dumps(expected, ensure_ascii=False)[:300]}')
+        print(f'  candidate: {json.dumps(got, ensure_ascii=False)[:300]}')
+
+
+def main():
+    checks = make_checks()
+    names = [c.name for c in checks]
+    parser = argparse.ArgumentParser(description='Compare the reference and optimized implementations.')
+    parser.add_argument('checks', nargs='*', metavar='CHECK', help=f'One of {", ".join(names)}. Default: all')
+    parser.add_argument('--size', type=int, default=2000, help='Number of inputs per check')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--show', type=int, default=3, help='Number of differing outputs to print per check')
+    args = parser.parse_args()
+    if unknown := set(args.checks) - set(names):
+        parser.error(f'unknown checks: {", ".join(sorted(unknown))}')
+    # Build the data and indexes before timing anything
+    current().warm()
+    failed = False
+    for check in checks:
+        if args.checks and check.name not in args.checks:
+            continue
+        report = run(check, args.size, args.seed)
+        print_report(check, report, args.show)
+        failed = has_failed(check, report) or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from fastapi import Query
+from fastapi.responses import Response
+from starlette.datastructures import URL
+
+from .lookup import MAX_BULK_CODES, DivisionIndex, parse_codes
+
+
+@dataclass
+class ListingParams:
+    """Query parameters shared by the list endpoints, to look up by codes, paginate and pick fields."""
+
+    codes: str = Query(
+        '',
+        title='Codes to look up',
+        examples=['1,4,6'],
+        description='Comma-separated codes. If given, only the divisions with these codes are returned, in that order. '
+        'Cannot be combined with filters or pagination.',
+    )
+    after: int | None = Query(
+        None,
+        title='Cursor',
+        description='Only return divisions whose code is greater than this. '
+        'The URL of the next page is given in the `Link` header.',
+    )
+    limit: int | None = Query(None, ge=1, le=MAX_BULK_CODES, title='Page size')
+    fields: str = Query(
+        '',
+        title='Fields to include',
+        examples=['code,name'],
+        description='Comma-separated field names. If given, other fields are left out of the response.',
+    )
+
+    @property
+    def active(self) -> bool:
+        """Whether the request asks for anything more than the full listing."""
+        return bool(self.codes or self.fields) or self.after is not None or self.limit is not None
+
+
+def json_response(content: bytes) -> Response:
+    """Respond with pre-rendered JSON, skipping the validation and serialization of FastAPI."""
+    return Response(content, media_type='application/json')
+
+
+def render_listing(index: DivisionIndex, params: ListingParams, url: URL, within: Sequence[int] | None = None):
+    """
+    Build the response for a list endpoint from the pre-rendered fragments.
+
+    Raise ValueError if the codes or fields are invalid, or if codes are combined with filters or pagination.
+    """
+    fields = index.check_fields(s.strip() for s in params.fields.split(',') if s.strip())
+    if params.codes:
+        # They would be silently ignored
+        if within is not None:
+            raise ValueError('Codes cannot be combined with a search or parent division filter')
+        if params.after is not None or params.limit is not None:
+            raise ValueError('Codes cannot be combined with pagination')
+        return json_response(index.render_many(parse_codes(params.codes), fields))
+    page, next_after = index.page(params.after, params.limit, within)
+    response = json_response(index.render_many(page, fields))
+    if next_after is not None:
+        next_url = url.include_query_params(after=next_after, limit=params.limit)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
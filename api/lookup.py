@@ -0,0 +1,165 @@
+import json
+from bisect import bisect_right
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
+from operator import attrgetter
+from typing import Any
+
+from unidecode import unidecode
+
+
+# Upper bound of codes accepted by one multi-get request, also the maximum page size.
+MAX_BULK_CODES = 1000
+
+
+def render(data: Any) -> bytes:
+    # Same options as FastAPI's JSONResponse, so the output is byte-identical to the normal path.
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode()
+
+
+@dataclass(frozen=True)
+class DivisionIndex:
+    """
+    Code -> record hash index, with each record pre-rendered to a JSON fragment.
+
+    The fragments are rendered with the same defaults as the response models,
+    so they can be joined and sent without going through pydantic again.
+    Each field is also pre-rendered separately (like `"name":"Phường Phúc Xá"`), to serve sparse fieldsets.
+    """
+
+    records: dict[int, Any]
+    # Code -> field name -> rendered "key":value pair
+    members: dict[int, dict[str, bytes]]
+    fragments: dict[int, bytes]
+    # All codes, sorted, for binary search when paginating
+    codes: tuple[int, ...]
+    # All codes, in the order of the data source
+    order: tuple[int, ...]
+    # Name of the attribute pointing to the parent division, like "province_code"
+    parent_field: str | None = None
+    # Code -> other names, like "Sài Gòn", found by address parsing but never rendered, nor searched by keywords,
+    # not to mix divisions found by a former name, like a merged province, with those found by their name
+    aliases: dict[int, tuple[str, ...]] = field(default_factory=dict)
+
+    @cached_property
+    def fields(self) -> tuple[str, ...]:
+        return tuple(next(iter(self.members.values()), {}))
+
+    @cached_property
+    def children(self) -> dict[int, tuple[int, ...]]:
+        """Mapping of parent code -> codes of its subdivisions, in the order of the data source."""
+        if not self.parent_field:
+            return {}
+        groups: defaultdict[int, list[int]] = defaultdict(list)
+        for code in self.order:
+            groups[int(getattr(self.records[code], self.parent_field))].append(code)
+        return {k: tuple(v) for k, v in groups.items()}
+
+    @cached_property
+    def sorted_children(self) -> dict[int, tuple[int, ...]]:
+        """Mapping of parent code -> codes of its subdivisions, sorted, to paginate over with `page()`."""
+        return {k: tuple(sorted(v)) for k, v in self.children.items()}
+
+    @cached_property
+    def folded_names(self) -> dict[int, str]:
+        """Mapping of code -> name without accents, in lower case, for keyword search. Aliases are not searched."""
+        return {code: unidecode(obj.name).lower() for code, obj in self.records.items()}
+
+    def get(self, code: int) -> Any | None:
+        return self.records.get(code)
+
+    def iter_records(self, codes: Iterable[int] | None = None) -> Iterator[Any]:
+        """Iterate over the records of given codes, or all records in the order of the data source."""
+        records = self.records
+        return (records[c] for c in (self.order if codes is None else codes))
+
+    def warm(self):
+        """Compute the lazy attributes now, so that the first request doesn't have to."""
+        self.fields, self.children, self.sorted_children, self.folded_names
+
+    def check_fields(self, fields: Iterable[str]) -> tuple[str, ...]:
+        fields = tuple(dict.fromkeys(fields))
+        unknown = set(fields).difference(self.fields)
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        return fields
+
+    def page(
+        self, after: int | None, limit: int | None, within: Sequence[int] | None = None
+    ) -> tuple[Sequence[int], int | None]:
+        """
+        Get the codes following `after`, up to `limit` of them, and the cursor for the next page.
+
+        `within` is a sorted subset of codes to paginate over, like the wards of one province.
+        """
+        codes = self.codes if within is None else within
+        start = 0 if after is None else bisect_right(codes, after)
+        if limit is None:
+            return codes[start:], None
+        end = start + limit
+        page = codes[start:end]
+        return page, (page[-1] if end < len(codes) else None)
+
+    def render_with(self, code: int, key: str, value: bytes) -> bytes:
+        """Render a record with one field replaced by pre-rendered JSON, like the list of its subdivisions."""
+        pair = render(key) + b':' + value
+        return b'{' + b','.join(pair if k == key else v for k, v in self.members[code].items()) + b'}'
+
+    def render_many(self, codes: Iterable[int], fields: Sequence[str] = ()) -> bytes:
+        # Unknown codes are skipped, the rest keep the requested order.
+        if fields:
+            members = self.members
+            items: Iterable[bytes] = (
+                b'{' + b','.join(members[c][f] for f in fields) + b'}' for c in codes if c in members
+            )
+        else:
+            fragments = self.fragments
+            items = (fragments[c] for c in codes if c in fragments)
+        return b'[' + b','.join(items) + b']'
+
+
+def build_index(
+    items: Iterable[Any], defaults: dict[str, Any] | None = None, parent_field: str | None = None
+) -> DivisionIndex:
+    items = tuple(items)
+    order = tuple(int(obj.code) for obj in items)
+    records: dict[int, Any] = {}
+    members: dict[int, dict[str, bytes]] = {}
+    fragments: dict[int, bytes] = {}
+    for obj in sorted(items, key=attrgetter('code')):
+        data = asdict(obj)
+        if defaults:
+            data.update(defaults)
+        code = int(obj.code)
+        records[code] = obj
+        members[code] = {k: render({k: v})[1:-1] for k, v in data.items()}
+        fragments[code] = b'{' + b','.join(members[code].values()) + b'}'
+    return DivisionIndex(records, members, fragments, tuple(records), order, parent_field)
+
+
+def make_encoder(fields: Sequence[str]) -> Callable[[Any], dict[str, Any]]:
+    """
+    Build a function turning an object into a dict of the given attributes, in this order, for `render`.
+
+    It is for objects built per request, like search results: give it the fields of the response model,
+    and the output is the same as FastAPI's, without `asdict` copying and pydantic validating each object.
+    """
+    names = tuple(fields)
+    get = attrgetter(*names)
+    if len(names) == 1:
+        return lambda obj: {names[0]: get(obj)}
+    return lambda obj: dict(zip(names, get(obj)))
+
+
+def parse_codes(value: str) -> tuple[int, ...]:
+    """Parse comma-separated codes, like "1,4,6". Raise ValueError if the string is malformed or too long."""
+    codes = unique_codes(tuple(int(s) for s in value.split(',') if s.strip()))
+    if len(codes) > MAX_BULK_CODES:
+        raise ValueError(f'Too many codes, maximum is {MAX_BULK_CODES}')
+    return codes
+
+
+def unique_codes(codes: Sequence[int]) -> tuple[int, ...]:
+    return tuple(dict.fromkeys(codes))
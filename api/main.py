@@ -1,5 +1,7 @@
+import asyncio
 import os
 import sys
+from contextlib import asynccontextmanager
 from http import HTTPStatus
 
 from fastapi import FastAPI, Request
@@ -7,18 +9,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from logbook import Logger, StreamHandler
 from logbook.more import ColorizedStderrHandler
-from pydantic_settings import BaseSettings
 
 from . import __version__
+from .admission import AdmissionMiddleware, controller
+from .config import settings
+from .snapshot import Watcher, current, reload
 from .v1 import api_v1
 from .v2 import api_v2
 
 
-class Settings(BaseSettings):
-    tracking: bool = False
-    cdn_cache_interval: int = 30
-
-
 logger = Logger(__name__)
 
 if not os.getenv('VERCEL'):
@@ -27,21 +26,31 @@ else:
     StreamHandler(sys.stdout).push_application()
 
 
+@asynccontextmanager
+async def lifespan(app):
+    # Build the data snapshot and search indexes before serving the first request.
+    # The mounted apps don't receive lifespan events, so it is done here.
+    # Unless it was done before forking this worker, by `serve.py`.
+    snapshot = current()
+    if not (snapshot.warmed and snapshot.data_dir == settings.data_dir):
+        logger.debug('To load data and build indexes')
+        await asyncio.to_thread(reload, settings.data_dir)
+    logger.debug('Ready to serve')
+    watcher = None
+    if settings.data_dir:
+        watcher = Watcher(settings.data_dir, settings.data_poll_interval)
+        watcher.start()
+    yield
+    if watcher:
+        watcher.stop()
+
+
 app = FastAPI(
     title='Vietnam Provinces online API',
     version=__version__,
+    lifespan=lifespan,
 )
 
-# Configure CORS - Allow all origins
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins
-    allow_credentials=False,
-    allow_methods=["*"],  # Allow all methods (GET, POST, etc.)
-    allow_headers=["*"],  # Allow all headers
-)
-
-settings = Settings()
 app.mount('/api/v1', api_v1)
 app.mount('/api/v2', api_v2)
 
@@ -57,3 +66,17 @@ async def guide_cdn_cache(request: Request, call_next):
     # Ref: https://vercel.com/docs/edge-network/headers#cache-control-header
     response.headers['Cache-Control'] = f's-maxage={settings.cdn_cache_interval}, stale-while-revalidate'
     return response
+
+
+# Each middleware wraps those registered before it. Admission wraps the cache middleware, so that its rejections
+# are not cached by the CDN, and is wrapped by CORS, so that browsers can read them, with their Retry-After.
+app.add_middleware(AdmissionMiddleware, admission=controller())
+
+# Configure CORS - Allow all origins
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Allow all origins
+    allow_credentials=False,
+    allow_methods=["*"],  # Allow all methods (GET, POST, etc.)
+    allow_headers=["*"],  # Allow all headers
+)
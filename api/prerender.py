@@ -0,0 +1,178 @@
+"""
+Render every read-only endpoint to static, precompressed JSON files, to be served by nginx or a CDN.
+
+Usage:
+
+    python -m api.prerender build/static --nginx build/vn-provinces-static.conf
+
+A response for `/api/v1/p/1?depth=2` is saved to `build/static/api/v1/p/1/index2.json`,
+and `/api/v1/p/1` to `build/static/api/v1/p/1/index.json`, each with a `.gz` sibling.
+The generated nginx config serves those files and passes other requests
+(search, address parsing, filtering, pagination, ...) to the app.
+"""
+
+import argparse
+import asyncio
+import gzip
+from collections.abc import Iterator
+from pathlib import Path
+
+from logbook import Logger
+
+from .snapshot import current
+
+
+logger = Logger(__name__)
+
+NGINX_TEMPLATE = """\
+# Generated by `python -m api.prerender`, do not edit.
+# Include this file in the `server` block of nginx.conf, in place of its `location /` block.
+# Requests which only have an optional `depth` argument are served from the pre-rendered files,
+# the others go to the app.
+
+location /api/ {{
+    error_page 418 = @api;
+    if ($args !~ "^(depth=[0-9])?$") {{
+        return 418;
+    }}
+    root {root};
+    gzip_static on;
+    default_type application/json;
+    add_header Cache-Control "s-maxage={cache_interval}, stale-while-revalidate";
+    add_header Access-Control-Allow-Origin "*";
+    try_files $uri/index$arg_depth.json @api;
+}}
+
+location / {{
+    proxy_pass http://{upstream};
+    proxy_set_header Host $host;
+    proxy_set_header X-Real-IP $remote_addr;
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto $scheme;
+    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection "upgrade";
+}}
+
+# Also for the type-ahead search sessions, which are WebSockets
+location @api {{
+    proxy_pass http://{upstream};
+    proxy_set_header Host $host;
+    proxy_set_header X-Real-IP $remote_addr;
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto $scheme;
+    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection "upgrade";
+}}
+"""
+
+
+def iter_targets() -> Iterator[tuple[str, int | None]]:
+    """Yield (path, depth) of all responses to render. Depth None means the request has no query string."""
+    snapshot = current()
+    # The full dumps of the root endpoints with depth > 1 are left to the app, to keep the client blacklist.
+    for path in ('/api/v1/', '/api/v2/'):
+        yield path, None
+        yield path, 1
+    for path in ('/api/v1/p/', '/api/v1/d/', '/api/v1/w/', '/api/v1/version', '/api/v2/p/', '/api/v2/w/'):
+        yield path, None
+    for code in snapshot.v1.provinces.codes:
+        yield f'/api/v1/p/{code}', None
+        for depth in (1, 2, 3):
+            yield f'/api/v1/p/{code}', depth
+    for code in snapshot.v1.districts.codes:
+        yield f'/api/v1/d/{code}', None
+        for depth in (1, 2):
+            yield f'/api/v1/d/{code}', depth
+    for code in snapshot.v1.wards.codes:
+        yield f'/api/v1/w/{code}', None
+    for code in snapshot.v2.provinces.codes:
+        yield f'/api/v2/p/{code}', None
+        for depth in (1, 2):
+            yield f'/api/v2/p/{code}', depth
+    for code in snapshot.v2.wards.codes:
+        yield f'/api/v2/w/{code}', None
+
+
+async def fetch(app, path: str, query: str = '') -> tuple[int, bytes]:
+    """Call the ASGI app in-process, and collect the response status and body."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': [(b'host', b'localhost')],
+        # No client address, so that the rate limit doesn't apply to this build
+        'client': None,
+        'server': ('localhost', 80),
+    }
+    status = 0
+    chunks: list[bytes] = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status, b''.join(chunks)
+
+
+def file_path(output: Path, path: str, depth: int | None) -> Path:
+    name = 'index.json' if depth is None else f'index{depth}.json'
+    return output.joinpath(path.strip('/'), name)
+
+
+async def render_all(app, output: Path) -> int:
+    count = 0
+    for path, depth in iter_targets():
+        status, body = await fetch(app, path, '' if depth is None else f'depth={depth}')
+        if status != 200:
+            logger.warning('Skip {} (depth {}), got status {}', path, depth, status)
+            continue
+        target = file_path(output, path, depth)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(body)
+        # mtime=0 to make the build reproducible
+        target.with_name(target.name + '.gz').write_bytes(gzip.compress(body, 9, mtime=0))
+        count += 1
+    return count
+
+
+def render_nginx_config(root: Path, upstream: str, cache_interval: int) -> str:
+    return NGINX_TEMPLATE.format(root=root, upstream=upstream, cache_interval=cache_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-render read-only API endpoints to static JSON files.')
+    parser.add_argument('output', type=Path, help='Directory to write the files to')
+    parser.add_argument('--nginx', type=Path, help='Where to write the nginx config for serving the files')
+    parser.add_argument('--root', type=Path, help='Path of the output directory on the web server, if different')
+    parser.add_argument('--upstream', default='vn_provinces_api', help='Name of the nginx upstream of the app')
+    args = parser.parse_args()
+
+    from .main import app, settings
+    from .snapshot import reload
+
+    reload(settings.data_dir)
+    count = asyncio.run(render_all(app, args.output))
+    logger.info('Rendered {} responses to {}', count, args.output)
+    if args.nginx:
+        root = args.root or args.output.resolve()
+        args.nginx.write_text(render_nginx_config(root, args.upstream, settings.cdn_cache_interval))
+        logger.info('Wrote nginx config to {}', args.nginx)
+
+
+if __name__ == '__main__':
+    main()
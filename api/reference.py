@@ -0,0 +1,209 @@
+"""
+Reference implementations of the address parsing and search, kept as they were before any optimization.
+
+They are deliberately simple and slow: `python -m api.differential` runs them side by side with the ones in use,
+to catch changes of behaviour. Don't optimize them. Change them only when the expected behaviour changes.
+The address parsers in use have been replaced by a scored parser, which finds more wards: the ones here are kept
+as the baseline of accuracy.
+"""
+
+import re
+from typing import Any
+
+from unidecode import unidecode
+
+from .search import DivisionLevel, SearchHit, locate
+from .snapshot import V1Data, V2Data
+
+
+def parse_address_v1(address: str, data: V1Data) -> dict[str, Any]:
+    parts = [p.strip() for p in address.split(',')]
+    result: dict[str, Any] = {
+        'province': None,
+        'province_code': None,
+        'district': None,
+        'district_code': None,
+        'ward': None,
+        'ward_code': None,
+        'street': None,
+    }
+    province_found = None
+    for part in reversed(parts):
+        for province in data.provinces.iter_records():
+            part_normalized = unidecode(part.lower())
+            province_normalized = unidecode(province.name.lower())
+            part_clean = re.sub(r'^(tinh|thanh pho|tp\.?)\s+', '', part_normalized)
+            province_clean = re.sub(r'^(tinh|thanh pho|tp\.?)\s+', '', province_normalized)
+            if part_clean in province_clean or province_clean in part_clean:
+                province_found = province
+                result['province'] = province.name
+                result['province_code'] = province.code
+                break
+        if province_found:
+            break
+    if not province_found:
+        for part in reversed(parts):
+            part_normalized = unidecode(part.lower()).strip()
+            for province in data.provinces.iter_records():
+                province_name_simple = unidecode(province.name.lower())
+                if len(part_normalized) >= 3 and part_normalized in province_name_simple:
+                    province_found = province
+                    result['province'] = province.name
+                    result['province_code'] = province.code
+                    break
+            if province_found:
+                break
+    if province_found:
+        for part in parts:
+            for district in data.districts.iter_records(data.districts.children.get(province_found.code, ())):
+                part_normalized = unidecode(part.lower())
+                district_normalized = unidecode(district.name.lower())
+                part_clean = re.sub(r'^(huyen|quan|thi xa|thanh pho)\s+', '', part_normalized)
+                district_clean = re.sub(r'^(huyen|quan|thi xa|thanh pho)\s+', '', district_normalized)
+                if part_clean in district_clean or district_clean in part_clean:
+                    result['district'] = district.name
+                    result['district_code'] = district.code
+                    break
+            if result['district']:
+                break
+    if result['district_code']:
+        ward_codes = data.wards.children.get(result['district_code'], ())
+        for part in parts:
+            for ward in data.wards.iter_records(ward_codes):
+                part_normalized = unidecode(part.lower())
+                ward_normalized = unidecode(ward.name.lower())
+                part_clean = re.sub(r'^(phuong|xa|thi tran|tt\.?)\s+', '', part_normalized)
+                ward_clean = re.sub(r'^(phuong|xa|thi tran|tt\.?)\s+', '', ward_normalized)
+                if part_clean in ward_clean or ward_clean in part_clean:
+                    result['ward'] = ward.name
+                    result['ward_code'] = ward.code
+                    break
+            if result['ward']:
+                break
+    for part in parts:
+        part_normalized = unidecode(part.lower())
+        is_division = False
+        for key in ['province', 'district', 'ward']:
+            if result[key] and part_normalized in unidecode(result[key].lower()):
+                is_division = True
+                break
+        if not is_division and part.strip():
+            result['street'] = part.strip()
+            break
+    return result
+
+
+def parse_address_v2(address: str, data: V2Data) -> dict[str, Any]:
+    parts = [p.strip() for p in address.split(',')]
+    result: dict[str, Any] = {'province': None, 'province_code': None, 'ward': None, 'ward_code': None, 'street': None}
+    province_found = None
+    for part in reversed(parts):
+        for province in data.provinces.iter_records():
+            part_normalized = unidecode(part.lower())
+            province_normalized = unidecode(province.name.lower())
+            part_clean = re.sub(r'^(tinh|thanh pho|tp\.?)\s+', '', part_normalized)
+            province_clean = re.sub(r'^(tinh|thanh pho|tp\.?)\s+', '', province_normalized)
+            if part_clean in province_clean or province_clean in part_clean:
+                province_found = province
+                result['province'] = province.name
+                result['province_code'] = province.code
+                break
+        if province_found:
+            break
+    if not province_found:
+        for part in reversed(parts):
+            part_normalized = unidecode(part.lower()).strip()
+            for province in data.provinces.iter_records():
+                province_name_simple = unidecode(province.name.lower())
+                if len(part_normalized) >= 3 and part_normalized in province_name_simple:
+                    province_found = province
+                    result['province'] = province.name
+                    result['province_code'] = province.code
+                    break
+            if province_found:
+                break
+    if province_found:
+        wards = list(data.wards.iter_records(data.wards.children.get(province_found.code, ())))
+        for part in parts:
+            for ward in wards:
+                part_normalized = unidecode(part.lower())
+                ward_normalized = unidecode(ward.name.lower())
+                part_clean = re.sub(r'^(phuong|xa|thi tran|tt\.?)\s+', '', part_normalized)
+                ward_clean = re.sub(r'^(phuong|xa|thi tran|tt\.?)\s+', '', ward_normalized)
+                if part_clean in ward_clean or ward_clean in part_clean:
+                    result['ward'] = ward.name
+                    result['ward_code'] = ward.code
+                    break
+            if result['ward']:
+                break
+    for part in parts:
+        part_normalized = unidecode(part.lower())
+        is_division = False
+        for key in ['province', 'ward']:
+            if result[key] and part_normalized in unidecode(result[key].lower()):
+                is_division = True
+                break
+        if not is_division and part.strip():
+            result['street'] = part.strip()
+            break
+    return result
+
+
+def search_wards_v2(query: str, data: V2Data, province_code: int = 0) -> list[int]:
+    """Codes of the wards whose unaccented name contains all the words of the query."""
+    if province_code:
+        wards = tuple(data.wards.iter_records(data.wards.children.get(province_code, ())))
+    else:
+        wards = tuple(data.wards.iter_records())
+    keywords = query.strip().lower().split()
+    if not keywords:
+        return [int(w.code) for w in wards]
+    unaccent_ward_mapping = {w.code: unidecode(w.name).lower() for w in wards}
+    unaccent_keywords = tuple(unidecode(w) for w in keywords)
+    return [int(w.code) for w in wards if all(word in unaccent_ward_mapping[w.code] for word in unaccent_keywords)]
+
+
+def search_v1(
+    query: str,
+    data: V1Data,
+    level: DivisionLevel,
+    district_code: int | None = None,
+    province_code: int | None = None,
+) -> tuple[SearchHit, ...]:
+    """Per-level lunr search, looking up the records of each hit. Uses the lunr indexes of `data.searcher`."""
+    searcher = data.searcher
+    searcher.warm()
+    if level == DivisionLevel.P:
+        index = searcher.province_index
+    elif level == DivisionLevel.D:
+        index = searcher.district_index
+    else:
+        index = searcher.ward_index
+    assert index
+    dresults: dict[int, SearchHit] = {}
+    for r in index.search(query):
+        code = int(r['ref'])
+        for term in r['match_data'].metadata:
+            if level == DivisionLevel.P:
+                obj = data.provinces.records[code]
+            elif level == DivisionLevel.D:
+                obj = data.districts.records[code]
+                if province_code and obj.province_code != province_code:
+                    continue
+            else:
+                obj = data.wards.records[code]
+                if district_code and obj.district_code != district_code:
+                    continue
+                elif province_code:
+                    if data.districts.records[obj.district_code].province_code != province_code:
+                        continue
+            matches = {}
+            try:
+                matches[term] = locate(obj.name, term)
+            except ValueError:
+                continue
+            try:
+                dresults[code].matches.update(matches)
+            except KeyError:
+                dresults[code] = SearchHit(code=code, name=obj.name, matches=matches)
+    return tuple(dresults.values())
@@ -1,8 +1,9 @@
-from enum import Enum
 from typing import Annotated
 
 from pydantic import BaseModel, ConfigDict, Field, JsonValue
 
+from .lookup import MAX_BULK_CODES
+from .search import DivisionLevel
 from .vendor.vietnam_provinces import VietNamDivisionType
 
 
@@ -12,12 +13,6 @@ from .vendor.vietnam_provinces import VietNamDivisionType
 # - FastAPI haven't supported dataclasses
 
 
-class DivisionLevel(str, Enum):
-    P = 'province'
-    D = 'district'
-    W = 'ward'
-
-
 _EXAMPLE_WARD: dict[str, JsonValue] = {
     'name': 'Phường Phúc Xá',
     'code': 1,
@@ -76,6 +71,11 @@ class ProvinceResponse(BaseModel):
     districts: Annotated[list[District], Field(default_factory=list)]
 
 
+class CodeList(BaseModel):
+    model_config = ConfigDict(json_schema_extra={'examples': [{'codes': [1, 4, 6]}]})
+    codes: Annotated[list[int], Field(max_length=MAX_BULK_CODES)]
+
+
 class VersionResponse(BaseModel):
     data_version: str
 
@@ -99,3 +99,32 @@ class SearchResult(BaseModel):
             description='This info can help client side highlight the result in display.',
         ),
     ]
+
+
+_EXAMPLE_PATH_MATCH: dict[str, JsonValue] = {
+    'level': 'ward',
+    'code': 1,
+    'name': 'Phường Phúc Xá',
+    'matches': {'phuc': [7, 11]},
+    'district_code': 1,
+    'district_name': 'Quận Ba Đình',
+    'province_code': 1,
+    'province_name': 'Thành phố Hà Nội',
+    'full_name': 'Phường Phúc Xá, Quận Ba Đình, Thành phố Hà Nội',
+}
+
+
+class PathSearchResult(BaseModel):
+    model_config = ConfigDict(json_schema_extra={'examples': [_EXAMPLE_PATH_MATCH]})
+    level: DivisionLevel
+    code: int
+    name: str
+    matches: Annotated[
+        dict[str, tuple[int, int]],
+        Field({}, title='Matched words and their positions in name.'),
+    ]
+    district_code: Annotated[int | None, Field(None, title='Code of the parent district, for wards')]
+    district_name: str | None = None
+    province_code: Annotated[int | None, Field(None, title='Code of the parent province, for districts and wards')]
+    province_name: str | None = None
+    full_name: Annotated[str, Field(title='Name followed by the names of the parent divisions')]
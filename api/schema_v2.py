@@ -1,9 +1,11 @@
 from typing import Annotated
 
-from pydantic import ConfigDict, Field, JsonValue
+from pydantic import BaseModel, ConfigDict, Field, JsonValue
 from pydantic.dataclasses import dataclass
 from vietnam_provinces import Province, Ward
 
+from .lookup import MAX_BULK_CODES
+
 
 _EXAMPLE_PROVINCE: dict[str, JsonValue] = {
     'name': 'Thành phố Hà Nội',
@@ -30,3 +32,34 @@ class ProvinceResponse(Province):
 @dataclass(frozen=True, config=ConfigDict(json_schema_extra={'examples': [_EXAMPLE_WARD]}))
 class WardResponse(Ward):
     pass
+
+
+class VersionResponse(BaseModel):
+    data_version: str
+
+
+@dataclass(frozen=True)
+class ProvinceChanges:
+    added: tuple[Province, ...]
+    removed: tuple[int, ...]
+    changed: Annotated[tuple[Province, ...], Field(description='Renamed or otherwise modified, with current data')]
+
+
+@dataclass(frozen=True)
+class WardChanges:
+    added: tuple[Ward, ...]
+    removed: tuple[int, ...]
+    changed: Annotated[tuple[Ward, ...], Field(description='Renamed or otherwise modified, with current data')]
+
+
+@dataclass(frozen=True)
+class ChangesResponse:
+    since: str
+    data_version: str
+    provinces: ProvinceChanges
+    wards: WardChanges
+
+
+class CodeList(BaseModel):
+    model_config = ConfigDict(json_schema_extra={'examples': [{'codes': [26560, 26566]}]})
+    codes: Annotated[list[int], Field(max_length=MAX_BULK_CODES)]
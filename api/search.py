@@ -1,18 +1,24 @@
 import re
-from typing import Any, Protocol, cast
+import threading
+from collections import deque
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Protocol
 
-from logbook import Logger
-from lunr import lunr
-from lunr.index import Index
 from unidecode import unidecode
 
-from .schema_v1 import DivisionLevel, SearchResult
-from .vendor.vietnam_provinces.base import District, Province, Ward
-from .vendor.vietnam_provinces.enums.districts import DistrictEnum, ProvinceEnum
-from .vendor.vietnam_provinces.enums.wards import WardEnum
+from .lookup import DivisionIndex
 
 
-logger = Logger(__name__)
+if TYPE_CHECKING:
+    from lunr.index import Index
+
+
+class DivisionLevel(str, Enum):
+    P = 'province'
+    D = 'district'
+    W = 'ward'
 
 
 class BaseRegion(Protocol):
@@ -20,79 +26,193 @@ class BaseRegion(Protocol):
     name: str
 
 
+@dataclass
+class SearchHit:
+    code: int
+    name: str
+    # Matched words and their positions in name
+    matches: dict[str, tuple[int, int]] = field(default_factory=dict)
+
+
+class InvalidQueryError(ValueError):
+    """The query doesn't follow lunr syntax."""
+
+
+class QueryTooLongError(ValueError):
+    """The type-ahead query has too many characters or words."""
+
+
+@dataclass
+class PathHit:
+    """A search result of any level, with the codes and names of its parent divisions."""
+
+    level: DivisionLevel
+    code: int
+    name: str
+    matches: dict[str, tuple[int, int]] = field(default_factory=dict)
+    district_code: int | None = None
+    district_name: str | None = None
+    province_code: int | None = None
+    province_name: str | None = None
+    # Like "Phường Phúc Xá, Quận Ba Đình, Thành phố Hà Nội"
+    full_name: str = ''
+
+    @property
+    def ref(self) -> str:
+        return REF_PREFIXES[self.level] + str(self.code)
+
+
+# Refs of the documents in the merged index are the code prefixed by the level, like "w1".
+REF_PREFIXES = {DivisionLevel.P: 'p', DivisionLevel.D: 'd', DivisionLevel.W: 'w'}
+
+
 def to_search_doc(obj: BaseRegion):
     doc = {'code': obj.code, 'name': obj.name}
     doc['stripped_name'] = unidecode(obj.name)
     return doc
 
 
+def build_paths(
+    provinces: DivisionIndex, districts: DivisionIndex, wards: DivisionIndex
+) -> dict[DivisionLevel, dict[int, PathHit]]:
+    """Give each division its parents, so that search results need no more lookups."""
+    province_paths = {
+        p.code: PathHit(DivisionLevel.P, p.code, p.name, full_name=p.name) for p in provinces.iter_records()
+    }
+    district_paths = {}
+    for d in districts.iter_records():
+        province = province_paths[d.province_code]
+        district_paths[d.code] = PathHit(
+            DivisionLevel.D,
+            d.code,
+            d.name,
+            province_code=province.code,
+            province_name=province.name,
+            full_name=f'{d.name}, {province.full_name}',
+        )
+    ward_paths = {}
+    for w in wards.iter_records():
+        district = district_paths[w.district_code]
+        ward_paths[w.code] = PathHit(
+            DivisionLevel.W,
+            w.code,
+            w.name,
+            district_code=district.code,
+            district_name=district.name,
+            province_code=district.province_code,
+            province_name=district.province_name,
+            full_name=f'{w.name}, {district.full_name}',
+        )
+    return {DivisionLevel.P: province_paths, DivisionLevel.D: district_paths, DivisionLevel.W: ward_paths}
+
+
 class Searcher:
+    """Full-text search on v1 data. The lunr indexes are built on first search, or with `warm()`."""
+
     ready = False
-    province_index: Index | None = None
-    district_index: Index | None = None
-    ward_index: Index | None = None
+    province_index: 'Index | None' = None
+    district_index: 'Index | None' = None
+    ward_index: 'Index | None' = None
+    # All levels in one index, for searching them at once
+    merged_index: 'Index | None' = None
+    paths: dict[DivisionLevel, dict[int, PathHit]]
+
+    def __init__(self, provinces: DivisionIndex, districts: DivisionIndex, wards: DivisionIndex):
+        self.provinces = provinces
+        self.districts = districts
+        self.wards = wards
+        self._lock = threading.Lock()
+
+    def warm(self):
+        if self.ready:
+            return
+        with self._lock:
+            if not self.ready:
+                self.build_index()
 
     def build_index(self):
+        # Imported here, so that lookup-only users don't pay for it
+        from lunr import lunr
+
+        self.paths = build_paths(self.provinces, self.districts, self.wards)
         self.province_index = lunr(
-            ref='code', fields=('name', 'stripped_name'), documents=tuple(to_search_doc(p.value) for p in ProvinceEnum)
+            ref='code',
+            fields=('name', 'stripped_name'),
+            documents=tuple(to_search_doc(p) for p in self.provinces.iter_records()),
         )
         self.district_index = lunr(
-            ref='code', fields=('name', 'stripped_name'), documents=tuple(to_search_doc(p.value) for p in DistrictEnum)
+            ref='code',
+            fields=('name', 'stripped_name'),
+            documents=tuple(to_search_doc(d) for d in self.districts.iter_records()),
         )
         self.ward_index = lunr(
-            ref='code', fields=('name', 'stripped_name'), documents=tuple(to_search_doc(p.value) for p in WardEnum)
+            ref='code',
+            fields=('name', 'stripped_name'),
+            documents=tuple(to_search_doc(w) for w in self.wards.iter_records()),
+        )
+        self.merged_index = lunr(
+            ref='ref',
+            fields=('name', 'stripped_name'),
+            documents=tuple(
+                {'ref': hit.ref, 'name': hit.name, 'stripped_name': unidecode(hit.name)}
+                for paths in self.paths.values()
+                for hit in paths.values()
+            ),
         )
         self.ready = True
 
+    def query(self, index: 'Index | None', query: str) -> tuple[dict[str, Any], ...]:
+        from lunr.exceptions import QueryParseError
+
+        try:
+            return index.search(query) if index else ()
+        except QueryParseError as e:
+            raise InvalidQueryError(str(e)) from e
+
     def search(
         self,
         query: str,
         level: DivisionLevel = DivisionLevel.P,
         district_code: int | None = None,
         province_code: int | None = None,
-    ) -> tuple[SearchResult, ...]:
-        if not self.ready:
-            logger.warning('Index building does not finished yet!')
-            return ()
+    ) -> tuple[SearchHit, ...]:
+        """Search with lunr query syntax. Raise InvalidQueryError if the query is malformed."""
+        self.warm()
         if level == DivisionLevel.P:
-            lresults: tuple[dict[str, Any], ...] = self.province_index.search(query) if self.province_index else ()
+            index = self.province_index
         elif level == DivisionLevel.D:
-            lresults = self.district_index.search(query) if self.district_index else ()
+            index = self.district_index
         else:
-            lresults = self.ward_index.search(query) if self.ward_index else ()
+            index = self.ward_index
+        lresults = self.query(index, query)
         if not lresults:
             return ()
+        paths = self.paths[level]
         # Lunrpy sometimes returns duplicate-like results
         # (same ref but different matches and scores). We will combine those.
-        dresults: dict[int, SearchResult] = {}
+        dresults: dict[int, SearchHit] = {}
         for r in lresults:
             code = int(r['ref'])
-            for term, fields in r['match_data'].metadata.items():
-                if level == DivisionLevel.P:
-                    obj: Province | District | Ward = ProvinceEnum[f'P_{code}'].value
-                elif level == DivisionLevel.D:
-                    obj = DistrictEnum[f'D_{code}'].value
-                    if province_code and obj.province_code != province_code:
-                        continue
-                else:
-                    obj = cast(Ward, WardEnum[f'W_{code}'].value)  # type: ignore[misc]
-                    if district_code and obj.district_code != district_code:
-                        continue
-                    elif province_code:
-                        dist: District = DistrictEnum[f'D_{obj.district_code}'].value
-                        if dist.province_code != province_code:
-                            continue
+            path = paths[code]
+            if level == DivisionLevel.D and province_code and path.province_code != province_code:
+                continue
+            if level == DivisionLevel.W:
+                if district_code and path.district_code != district_code:
+                    continue
+                elif province_code and path.province_code != province_code:
+                    continue
+            for term in r['match_data'].metadata:
                 # Find position of matched keyword, to help highlighting
                 matches = {}
                 try:
-                    matches[term] = locate(obj.name, term)
+                    matches[term] = locate(path.name, term)
                 except ValueError:
                     # There is a case, where keyword is "lai" but search engine returns "Mường Lay"
                     continue
                 try:
                     dresults[code].matches.update(matches)
                 except KeyError:
-                    dresults[code] = SearchResult(code=code, name=obj.name, matches=matches)
+                    dresults[code] = SearchHit(code=code, name=path.name, matches=matches)
         return tuple(dresults.values())
 
     def search_province(self, query: str):
@@ -104,6 +224,88 @@ class Searcher:
     def search_ward(self, query: str, district_code: int | None = None, province_code: int | None = None):
         return self.search(query, DivisionLevel.W, district_code, province_code)
 
+    def search_all(self, query: str, province_code: int | None = None, limit: int = 20) -> list[PathHit]:
+        """
+        Search all levels at once, in the merged index. Results are ranked by relevance,
+        and come with their parent divisions. Raise InvalidQueryError if the query is malformed.
+        """
+        self.warm()
+        hits: dict[str, PathHit] = {}
+        for r in self.query(self.merged_index, query):
+            ref = r['ref']
+            hit = hits.get(ref)
+            if not hit:
+                if len(hits) >= limit:
+                    break
+                path = self.paths[REF_LEVELS[ref[0]]][int(ref[1:])]
+                # Provinces are their own root
+                if province_code and (path.province_code or path.code) != province_code:
+                    continue
+            else:
+                path = hit
+            matches = {}
+            for term in r['match_data'].metadata:
+                try:
+                    matches[term] = locate(path.name, term)
+                except ValueError:
+                    continue
+            if not matches:
+                continue
+            if hit:
+                hit.matches.update(matches)
+            else:
+                hits[ref] = replace(path, matches=matches)
+        return list(hits.values())
+
+
+REF_LEVELS = {v: k for k, v in REF_PREFIXES.items()}
+
+
+# Type-ahead queries are checked against all the previous ones kept, keyword by keyword: keep them short.
+MAX_QUERY_LENGTH = 100
+MAX_KEYWORDS = 8
+
+
+def fold_keywords(query: str) -> tuple[str, ...]:
+    return tuple(unidecode(w) for w in query.lower().split())
+
+
+def match_keywords(names: Mapping[int, str], codes: Iterable[int], keywords: Sequence[str]) -> Iterator[int]:
+    """Keep the codes whose folded name (see `DivisionIndex.folded_names`) contains all the keywords."""
+    return (c for c in codes if all(k in names[c] for k in keywords))
+
+
+class IncrementalSearch:
+    """
+    Keyword search for type-ahead clients, which send a new query on each keystroke.
+
+    The results of the last queries are kept. When a query refines one of them, like "ha n" after "ha",
+    only those results are scanned, instead of all the divisions. A query refines another one
+    if each keyword of the other is part of one of its keywords, so that it can only match fewer divisions.
+    """
+
+    def __init__(self, names: Mapping[int, str], codes: Sequence[int], history_size: int = 8):
+        self.names = names
+        self.codes = codes
+        self.history: deque[tuple[tuple[str, ...], list[int]]] = deque(maxlen=history_size)
+
+    def search(self, query: str) -> Sequence[int]:
+        """Get the codes matching the query, in the order of `codes`. Raise `QueryTooLongError` beyond the limits."""
+        if len(query) > MAX_QUERY_LENGTH:
+            raise QueryTooLongError(f'Query longer than {MAX_QUERY_LENGTH} characters')
+        keywords = fold_keywords(query)
+        if len(keywords) > MAX_KEYWORDS:
+            raise QueryTooLongError(f'Query of more than {MAX_KEYWORDS} words')
+        if not keywords:
+            return self.codes
+        candidates = self.codes
+        for previous, results in self.history:
+            if len(results) < len(candidates) and all(any(p in k for k in keywords) for p in previous):
+                candidates = results
+        results = list(match_keywords(self.names, candidates, keywords))
+        self.history.append((keywords, results))
+        return results
+
 
 def locate(name: str, term: str):
     name = unidecode(name).lower()
@@ -112,6 +314,3 @@ def locate(name: str, term: str):
     if not m:
         raise ValueError
     return (m.start(0), m.end(0))
-
-
-repo = Searcher()
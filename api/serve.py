@@ -0,0 +1,154 @@
+"""
+Production server: load the data and build the indexes once, then fork workers which share them.
+
+    python -m api.serve --workers 4 --host 0.0.0.0 --port 8000
+
+The parent process imports the app and builds the data snapshot with all its indexes, like the app does on startup.
+The garbage collector is disabled meanwhile, then the objects are frozen (`gc.freeze`), so that the collector
+of the workers never writes to them, and the memory pages holding them stay shared, copy-on-write.
+Then the parent opens the listening socket and forks the workers, each serving it with uvicorn.
+A worker which dies is replaced. SIGTERM or SIGINT stops the workers gracefully, SIGUSR1 is passed on to them
+to reload the data from `DATA_DIR` (see `snapshot.py`).
+
+Data reloaded at runtime is built by each worker on its own, so it is not shared: restart the server to share it.
+The rate limit buckets are per worker too, unless they are in Redis (`RATE_LIMIT_REDIS_URL`).
+They are per client IP, taken from `X-Forwarded-For` if the request comes from one of `--forwarded-allow-ips`:
+behind a reverse proxy, set it to the address the proxy connects from, else all clients share one bucket.
+`python -m api.bench_workers` measures the throughput and memory against the number of workers.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+
+from logbook import Logger
+
+
+logger = Logger(__name__)
+
+# A worker dying sooner than this after its start is restarted with a delay, not to fork in a loop.
+MIN_UPTIME = 5
+RESTART_DELAY = 1
+
+
+def default_workers() -> int:
+    # Same variable as uvicorn and gunicorn
+    return int(os.environ.get('WEB_CONCURRENCY', 0)) or os.cpu_count() or 1
+
+
+def preload():
+    """Import the app and build the current snapshot, to be inherited by the workers."""
+    gc.disable()
+    from .config import settings
+    from .main import app
+    from .snapshot import current, reload
+
+    reload(settings.data_dir)
+    # If loading from `DATA_DIR` failed, the app falls back on the bundled data, like when it is started alone.
+    current().warm()
+    gc.freeze()
+    return app
+
+
+class Supervisor:
+    def __init__(self, app, sock: socket.socket, workers: int, log_level: str, forwarded_allow_ips: str):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.forwarded_allow_ips = forwarded_allow_ips
+        # PID -> start time
+        self.children: dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        # The worker must never return into the parent's loop. It exits with 1 on a crash, so that it is reported.
+        try:
+            self.run_worker()
+        except SystemExit as e:
+            os._exit(0 if e.code in (0, None) else 1)
+        except BaseException:
+            logger.exception('Worker {} crashed', os.getpid())
+            os._exit(1)
+        os._exit(0)
+
+    def run_worker(self):
+        import uvicorn
+
+        # The parent's handlers must not run in the worker. SIGUSR1 is only handled if the app watches `DATA_DIR`.
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        gc.enable()
+        config = uvicorn.Config(
+            self.app,
+            log_level=self.log_level,
+            timeout_graceful_shutdown=10,
+            proxy_headers=True,
+            forwarded_allow_ips=self.forwarded_allow_ips,
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def signal_children(self, signum: int):
+        for pid in self.children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def handle_stop(self, signum: int, frame):
+        logger.info('Stopping {} workers', len(self.children))
+        self.stopping = True
+        # Not SIGINT, which uvicorn takes as "force exit" if it already got one from the terminal
+        self.signal_children(signal.SIGTERM)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.signal_children(signal.SIGUSR1))
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info('Started {} workers: {}', self.workers, ', '.join(map(str, self.children)))
+        while self.children:
+            pid, status = os.wait()
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.error('Worker {} exited with status {}, restarting it', pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < MIN_UPTIME:
+                time.sleep(RESTART_DELAY)
+            if not self.stopping:
+                self.spawn()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the API with workers sharing the preloaded data.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=default_workers(), help='Default: $WEB_CONCURRENCY or CPUs')
+    parser.add_argument('--log-level', default='info')
+    parser.add_argument(
+        '--forwarded-allow-ips',
+        default=os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1'),
+        help='Comma-separated IPs or networks of the proxies to trust the X-Forwarded-For header of, or "*" for all. '
+        'Default: $FORWARDED_ALLOW_IPS or 127.0.0.1',
+    )
+    args = parser.parse_args()
+    import uvicorn
+
+    started = time.monotonic()
+    app = preload()
+    logger.info('Loaded data and indexes in {:.1f} s', time.monotonic() - started)
+    sock = uvicorn.Config(app, host=args.host, port=args.port).bind_socket()
+    Supervisor(app, sock, args.workers, args.log_level, args.forwarded_allow_ips).run()
+
+
+if __name__ == '__main__':
+    main()
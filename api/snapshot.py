@@ -0,0 +1,308 @@
+"""
+Division data and the indexes built from it, swappable at runtime.
+
+All data is held in a `Snapshot`. A request takes the current snapshot once, with `current()`,
+and uses it until the end, so it is not affected if new data is loaded meanwhile.
+The snapshot in use at start loads the data of each API version on first use, so that code embedding
+`api.core` only pays for what it uses. The server loads everything upfront, with `reload()`.
+New data is loaded from `DATA_DIR`, which is laid out as:
+
+    DATA_DIR/
+        v1/nested-divisions.json    # Same format as api/vendor/vietnam_provinces/data/nested-divisions.json
+        v1/data-version.txt
+        v2/nested-divisions.json    # Same format as vietnam_provinces' nested-divisions.json
+        v2/data-version.txt
+        aliases.json                # Same format as api/data/aliases.json
+
+If a version folder is missing, the bundled data is used for that API version, and likewise for the aliases.
+The aliases are compiled into the indexes of both versions (see `aliases.py`).
+`Watcher` checks the folder periodically, or when triggered by SIGUSR1,
+builds a new snapshot in the background, and swaps it in when it is complete.
+"""
+
+import json
+import signal
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from logbook import Logger
+
+from .address import AddressMatcher, Vocabulary
+from .aliases import ALIASES_FILENAME, Aliases, load_aliases
+from .lookup import DivisionIndex, build_index
+from .search import Searcher
+
+
+logger = Logger(__name__)
+
+NESTED_FILENAME = 'nested-divisions.json'
+VERSION_FILENAME = 'data-version.txt'
+
+
+@dataclass(frozen=True)
+class V1Data:
+    data_version: str
+    # The nested-divisions.json file, served as is by the full dumps
+    nested_json: bytes
+    provinces: DivisionIndex
+    districts: DivisionIndex
+    wards: DivisionIndex
+    searcher: Searcher
+    matcher: AddressMatcher
+
+
+@dataclass(frozen=True)
+class V2Data:
+    data_version: str
+    nested_json: bytes
+    provinces: DivisionIndex
+    wards: DivisionIndex
+    matcher: AddressMatcher
+
+
+def make_vocabulary(aliases: Aliases) -> Vocabulary:
+    return Vocabulary(aliases.abbreviations, aliases.spellings)
+
+
+def make_v1_data(data_version: str, nested_json: bytes, aliases: Aliases, provinces, districts, wards) -> V1Data:
+    province_index = aliases.apply('v1', 'provinces', build_index(provinces, {'districts': []}))
+    district_index = aliases.apply('v1', 'districts', build_index(districts, {'wards': []}, 'province_code'))
+    ward_index = aliases.apply('v1', 'wards', build_index(wards, parent_field='district_code'))
+    for index in (province_index, district_index, ward_index):
+        index.warm()
+    searcher = Searcher(province_index, district_index, ward_index)
+    matcher = AddressMatcher(province_index, district_index, ward_index, vocabulary=make_vocabulary(aliases))
+    return V1Data(data_version, nested_json, province_index, district_index, ward_index, searcher, matcher)
+
+
+def make_v2_data(data_version: str, nested_json: bytes, aliases: Aliases, provinces, wards) -> V2Data:
+    province_index = aliases.apply('v2', 'provinces', build_index(provinces, {'wards': []}))
+    ward_index = aliases.apply('v2', 'wards', build_index(wards, parent_field='province_code'))
+    for index in (province_index, ward_index):
+        index.warm()
+    matcher = AddressMatcher(province_index, ward_index, vocabulary=make_vocabulary(aliases))
+    return V2Data(data_version, nested_json, province_index, ward_index, matcher)
+
+
+# The bundled data never changes, so it is loaded only once per process, unless the aliases change.
+# Only the data built with the last aliases is kept: that of older aliases is freed with the snapshots using it.
+
+
+@lru_cache(maxsize=1)
+def load_bundled_v1(aliases: Aliases) -> V1Data:
+    from .vendor.vietnam_provinces import NESTED_DIVISIONS_JSON_PATH, __data_version__
+    from .vendor.vietnam_provinces.enums.districts import DistrictEnum, ProvinceEnum
+    from .vendor.vietnam_provinces.enums.wards import WardEnum
+
+    return make_v1_data(
+        __data_version__,
+        NESTED_DIVISIONS_JSON_PATH.read_bytes(),
+        aliases,
+        (p.value for p in ProvinceEnum),
+        (d.value for d in DistrictEnum),
+        (w.value for w in WardEnum),  # type: ignore[attr-defined]
+    )
+
+
+@lru_cache(maxsize=1)
+def load_bundled_v2(aliases: Aliases) -> V2Data:
+    from vietnam_provinces import NESTED_DIVISIONS_JSON_PATH, Province, Ward, __data_version__
+
+    return make_v2_data(
+        __data_version__, NESTED_DIVISIONS_JSON_PATH.read_bytes(), aliases, Province.iter_all(), Ward.iter_all()
+    )
+
+
+def read_folder(folder: Path) -> tuple[str, bytes, list[dict[str, Any]]]:
+    """Read the data version, and the nested divisions as bytes and parsed."""
+    # The bytes are kept for the full dumps, not to serve a file which may be replaced by new data meanwhile.
+    nested_json = (folder / NESTED_FILENAME).read_bytes()
+    data_version = (folder / VERSION_FILENAME).read_text().strip()
+    return data_version, nested_json, json.loads(nested_json)
+
+
+def load_v1_folder(folder: Path, aliases: Aliases) -> V1Data:
+    from .vendor.vietnam_provinces.base import District, Province, VietNamDivisionType, Ward
+
+    data_version, nested_json, nested = read_folder(folder)
+    provinces: list[Province] = []
+    districts: list[District] = []
+    wards: list[Ward] = []
+    for p in nested:
+        provinces.append(
+            Province(p['name'], p['code'], VietNamDivisionType(p['division_type']), p['codename'], p['phone_code'])
+        )
+        for d in p['districts']:
+            districts.append(
+                District(d['name'], d['code'], VietNamDivisionType(d['division_type']), d['codename'], p['code'])
+            )
+            wards.extend(
+                Ward(w['name'], w['code'], VietNamDivisionType(w['division_type']), w['codename'], d['code'])
+                for w in d['wards']
+            )
+    return make_v1_data(data_version, nested_json, aliases, provinces, districts, wards)
+
+
+def load_v2_folder(folder: Path, aliases: Aliases) -> V2Data:
+    from vietnam_provinces import Province, VietNamDivisionType, Ward
+
+    data_version, nested_json, nested = read_folder(folder)
+    provinces: list[Province] = []
+    wards: list[Ward] = []
+    for p in nested:
+        provinces.append(
+            Province(p['name'], p['code'], VietNamDivisionType(p['division_type']), p['codename'], p['phone_code'])
+        )
+        wards.extend(
+            Ward(w['name'], w['code'], VietNamDivisionType(w['division_type']), w['codename'], p['code'])
+            for w in p['wards']
+        )
+    return make_v2_data(data_version, nested_json, aliases, provinces, wards)
+
+
+def load_v1(data_dir: Path | None, aliases: Aliases) -> V1Data:
+    folder = data_dir / 'v1' if data_dir else None
+    return load_v1_folder(folder, aliases) if folder and folder.is_dir() else load_bundled_v1(aliases)
+
+
+def load_v2(data_dir: Path | None, aliases: Aliases) -> V2Data:
+    folder = data_dir / 'v2' if data_dir else None
+    return load_v2_folder(folder, aliases) if folder and folder.is_dir() else load_bundled_v2(aliases)
+
+
+class Snapshot:
+    """Data of both API versions, from `data_dir` if it has data, else from the bundled data, loaded on first use."""
+
+    # Whether everything is loaded, by `warm()`
+    warmed = False
+
+    def __init__(self, data_dir: Path | None = None):
+        self.data_dir = data_dir
+        self._v1: V1Data | None = None
+        self._v2: V2Data | None = None
+        self._aliases: Aliases | None = None
+        self._v1_lock = threading.Lock()
+        self._v2_lock = threading.Lock()
+
+    @property
+    def aliases(self) -> Aliases:
+        # Loading twice in a race is harmless, both versions get the same content.
+        if self._aliases is None:
+            self._aliases = load_aliases(self.data_dir)
+        return self._aliases
+
+    @property
+    def v1(self) -> V1Data:
+        if self._v1 is None:
+            with self._v1_lock:
+                if self._v1 is None:
+                    self._v1 = load_v1(self.data_dir, self.aliases)
+        return self._v1
+
+    @property
+    def v2(self) -> V2Data:
+        if self._v2 is None:
+            with self._v2_lock:
+                if self._v2 is None:
+                    self._v2 = load_v2(self.data_dir, self.aliases)
+        return self._v2
+
+    def warm(self) -> 'Snapshot':
+        """Load everything now, including the search and address indexes, so that no request has to."""
+        self.v1.searcher.warm()
+        self.v1.matcher.warm()
+        self.v2.matcher.warm()
+        self.warmed = True
+        return self
+
+
+def load(data_dir: Path | None = None) -> Snapshot:
+    """Build a complete snapshot, from `data_dir` if it has data, else from the bundled data."""
+    return Snapshot(data_dir).warm()
+
+
+_current = Snapshot()
+
+
+def current() -> Snapshot:
+    """Get the snapshot in use."""
+    return _current
+
+
+def swap(snapshot: Snapshot):
+    global _current
+    # Rebinding a global is atomic, the requests holding the old snapshot keep using it.
+    _current = snapshot
+
+
+def reload(data_dir: Path | None) -> bool:
+    """Build a new snapshot and swap it in. On failure, the old snapshot is kept."""
+    try:
+        snapshot = load(data_dir)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error('Failed to load data from {}: {}', data_dir, e)
+        return False
+    swap(snapshot)
+    logger.info(
+        'Loaded data version {} (v1), {} (v2), aliases {}',
+        snapshot.v1.data_version,
+        snapshot.v2.data_version,
+        snapshot.aliases.version,
+    )
+    return True
+
+
+class Watcher:
+    """Reload the data when files in `data_dir` change, or when triggered."""
+
+    def __init__(self, data_dir: Path, interval: float):
+        self.data_dir = data_dir
+        self.interval = interval
+        self._triggered = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='data-watcher', daemon=True)
+        self._fingerprint = self.fingerprint()
+
+    def fingerprint(self) -> tuple[tuple[str, int, int], ...]:
+        paths = [self.data_dir / v / n for v in ('v1', 'v2') for n in (NESTED_FILENAME, VERSION_FILENAME)]
+        paths.append(self.data_dir / ALIASES_FILENAME)
+        stats = []
+        for path in paths:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            stats.append((str(path), st.st_mtime_ns, st.st_size))
+        return tuple(stats)
+
+    def start(self):
+        self._thread.start()
+        try:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.trigger())
+        except ValueError:
+            # Not in the main thread, like when running in tests
+            logger.debug('Cannot listen to SIGUSR1')
+
+    def stop(self):
+        self._stopped = True
+        self._triggered.set()
+
+    def trigger(self):
+        self._triggered.set()
+
+    def _run(self):
+        while True:
+            triggered = self._triggered.wait(self.interval)
+            self._triggered.clear()
+            if self._stopped:
+                return
+            fingerprint = self.fingerprint()
+            if not triggered and fingerprint == self._fingerprint:
+                continue
+            # A failed load is only retried when the files change again, or when triggered, not on every poll.
+            # A file being written is retried once it is complete, as that changes its size or time.
+            self._fingerprint = fingerprint
+            reload(self.data_dir)
@@ -0,0 +1,65 @@
+"""
+Type-ahead search over WebSocket: the client sends its query on each keystroke, and gets the matching divisions.
+
+Each connection keeps an `IncrementalSearch`, so a query extending the previous ones only scans the previous results.
+Each reply has the query it answers, so the client can drop replies to outdated queries:
+
+    {"q": "ha n", "total": 42, "results": [...]}
+
+A query too long (see `search.MAX_QUERY_LENGTH` and `search.MAX_KEYWORDS`) closes the connection with code 1009,
+a binary message with code 1003, and going over the rate limit with code 1013.
+"""
+
+from collections.abc import Callable
+
+from fastapi import WebSocket, WebSocketDisconnect, status
+
+from .admission import RouteClass, controller
+from .lookup import DivisionIndex, render
+from .search import IncrementalSearch, QueryTooLongError
+from .snapshot import Snapshot, current
+
+
+# Builds the search session and gives the index to render the results with.
+SessionFactory = Callable[[Snapshot], tuple[IncrementalSearch, DivisionIndex]]
+
+
+async def serve(websocket: WebSocket, make_session: SessionFactory, limit: int):
+    admission = controller()
+    client_ip = websocket.client.host if websocket.client else None
+    # Opening a session costs like a search, each keystroke after that like a cheap request.
+    if client_ip and not await admission.take(client_ip, admission.cost(RouteClass.SEARCH)):
+        await websocket.close(status.WS_1013_TRY_AGAIN_LATER, 'too-many-requests')
+        return
+    await websocket.accept()
+    snapshot = current()
+    session, index = make_session(snapshot)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            query = message.get('text')
+            if query is None:
+                await websocket.close(status.WS_1003_UNSUPPORTED_DATA, 'text-only')
+                return
+            if client_ip and not await admission.take(client_ip, 1):
+                await websocket.close(status.WS_1013_TRY_AGAIN_LATER, 'too-many-requests')
+                return
+            if snapshot is not current():
+                # New data has been loaded, start over with it.
+                snapshot = current()
+                session, index = make_session(snapshot)
+            try:
+                codes = session.search(query)
+            except QueryTooLongError:
+                await websocket.close(status.WS_1009_MESSAGE_TOO_BIG, 'query-too-long')
+                return
+            content = b'{"q":%b,"total":%d,"results":%b}' % (
+                render(query),
+                len(codes),
+                index.render_many(codes[:limit]),
+            )
+            await websocket.send_text(content.decode())
+    except WebSocketDisconnect:
+        pass
@@ -1,19 +1,20 @@
-import os
-import re
-from collections.abc import Iterable, Iterator, Sequence
-from dataclasses import asdict
-from operator import attrgetter
-
-from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import FileResponse, RedirectResponse
-from fastapi_problem.error import NotFoundProblem
+from collections.abc import Sequence
+from typing import Literal
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.responses import RedirectResponse, Response
+from fastapi_problem.error import NotFoundProblem, UnprocessableProblem
 from fastapi_problem.handler import add_exception_handler, new_exception_handler
 from logbook import Logger
-from unidecode import unidecode
-from vietnam_provinces import NESTED_DIVISIONS_JSON_PATH, Province, ProvinceCode, Ward, WardCode
 
-from . import __version__
-from .schema_v2 import ProvinceResponse, WardResponse
+from . import __version__, typeahead
+from .admission import is_blacklisted
+from .changes import UnknownDataVersionError, compute_changes
+from .core import v2 as core
+from .listing import ListingParams, json_response, render_listing
+from .lookup import DivisionIndex, unique_codes
+from .schema_v2 import ChangesResponse, CodeList, ProvinceResponse, VersionResponse, WardResponse
+from .snapshot import Snapshot, current
 
 
 api_v2 = FastAPI(title='Vietnam Provinces online API (2025)', version=__version__)
@@ -30,275 +31,225 @@ class WardNotExistError(NotFoundProblem):
     title = 'Ward not exist'
 
 
+class DataVersionNotAvailableError(NotFoundProblem):
+    title = 'Data version not available'
+
+
+class InvalidListingQueryError(UnprocessableProblem):
+    title = 'Invalid listing query'
+
+
+def respond_listing(
+    index: DivisionIndex, params: ListingParams, request: Request, within: Sequence[int] | None = None
+) -> Response:
+    try:
+        return render_listing(index, params, request.url, within)
+    except ValueError as e:
+        raise InvalidListingQueryError(str(e)) from e
+
+
 @api_v2.get('/', response_model=tuple[ProvinceResponse, ...])
 def show_all_divisions(request: Request, depth: int = Query(1, ge=1, le=2, title='Show down to subdivisions')):
-    client_ip = request.client.host if request.client else None
-    if depth > 1:
-        env_value = os.getenv('BLACKLISTED_CLIENTS', '')
-        blacklist = filter(None, (s.strip() for s in env_value.split(',')))
-        if not client_ip or client_ip in blacklist:
-            raise HTTPException(429)
+    if depth > 1 and is_blacklisted(request):
+        raise HTTPException(429)
+    data = current().v2
     if depth >= 2:
-        return FileResponse(NESTED_DIVISIONS_JSON_PATH)
-    return tuple(asdict(p) for p in sorted(Province.iter_all(), key=attrgetter('code')))
+        return json_response(data.nested_json)
+    return json_response(data.provinces.render_many(data.provinces.codes))
 
 
-@api_v2.get('/p/')
-async def list_provinces(search: str = '') -> tuple[ProvinceResponse, ...]:
-    provinces = sorted(Province.iter_all(), key=attrgetter('code'))
+@api_v2.get('/p/', response_model=tuple[ProvinceResponse, ...])
+async def list_provinces(request: Request, search: str = '', params: ListingParams = Depends()) -> Response:
+    data = current().v2
     keywords = search.strip().lower().split()
     if keywords:
         logger.info('To filter by {}', keywords)
-        provinces = filter_provinces_by_keywords(provinces, keywords)
-    return tuple(ProvinceResponse(**asdict(p)) for p in provinces)
+    provinces = core.search_provinces(search, data=data)
+    if params.active:
+        within = tuple(int(p.code) for p in provinces) if keywords else None
+        return respond_listing(data.provinces, params, request, within)
+    return json_response(data.provinces.render_many(int(p.code) for p in provinces))
 
 
-@api_v2.get('/p/{code}')
+@api_v2.post('/p/', response_model=tuple[ProvinceResponse, ...])
+async def get_many_provinces(body: CodeList):
+    index = current().v2.provinces
+    return json_response(index.render_many(unique_codes(body.codes)))
+
+
+@api_v2.get('/p/{code}', response_model=ProvinceResponse)
 def get_province(
     code: int,
     depth: int = Query(1, ge=1, le=2, title='Show down to subdivisions', description='2: show wards'),
-) -> ProvinceResponse:
-    try:
-        pcode = ProvinceCode(code)
-    except ValueError as e:
-        raise ProvinceNotExistError(f'No province has code {code}') from e
-    response = asdict(Province.from_code(pcode))
+) -> Response:
+    data = current().v2
+    if code not in data.provinces.records:
+        raise ProvinceNotExistError(f'No province has code {code}')
     if depth >= 2:
-        wards = sorted(Ward.iter_by_province(pcode), key=attrgetter('code'))
-        response['wards'] = tuple(w for w in wards)
-    return ProvinceResponse(**response)
+        wards = data.wards.render_many(data.wards.sorted_children.get(code, ()))
+        return json_response(data.provinces.render_with(code, 'wards', wards))
+    return json_response(data.provinces.fragments[code])
 
 
-@api_v2.get('/w/', response_model=None)
+@api_v2.get('/w/', response_model=tuple[WardResponse, ...])
 async def list_wards(
-    request: Request, province: int = 0, search: str = ''
-) -> tuple[WardResponse, ...] | RedirectResponse:
+    request: Request, province: int = 0, search: str = '', params: ListingParams = Depends()
+) -> Response:
+    data = current().v2
     if province:
-        try:
-            province_code = ProvinceCode(province)
-        except ValueError:
+        if province not in data.provinces.records:
             # For invalid province code, redirect to new URL this this parameter stripped
             url = request.url.remove_query_params('province')
             logger.info('Redirect to {}', url)
             return RedirectResponse(url)
-        wards = Ward.iter_by_province(province_code)
-    else:
-        wards = Ward.iter_all()
+    index = data.wards
     keywords = search.strip().lower().split()
+    # Codes of the filtered wards, sorted. Without filter, the whole code-sorted index is used.
     if keywords:
         logger.info('To filter by {}', keywords)
-        # At this step, `wards` is an iterator, so when passing to filter_wards_by_keywords,
-        # we need to convert it to a sequence, to allow iterating over it many times.
-        wards = filter_wards_by_keywords(tuple(wards), keywords)
-    return tuple(WardResponse(**asdict(p)) for p in sorted(wards, key=attrgetter('code')))
+        within: Sequence[int] | None = sorted(int(w.code) for w in core.search_wards(search, province, data=data))
+    elif province:
+        within = index.sorted_children.get(province, ())
+    else:
+        within = None
+    if params.active:
+        return respond_listing(index, params, request, within)
+    return json_response(index.render_many(index.codes if within is None else within))
 
 
-@api_v2.get('/w/{code}')
-def get_ward(code: int) -> WardResponse:
+@api_v2.post('/w/', response_model=tuple[WardResponse, ...])
+async def get_many_wards(body: CodeList):
+    index = current().v2.wards
+    return json_response(index.render_many(unique_codes(body.codes)))
+
+
+@api_v2.get('/w/{code}', response_model=WardResponse)
+def get_ward(code: int):
     try:
-        wcode = WardCode(code)
-    except ValueError as e:
+        fragment = current().v2.wards.fragments[code]
+    except KeyError as e:
         raise WardNotExistError(f'No ward has code {code}') from e
-    return WardResponse(**asdict(Ward.from_code(wcode)))
+    return json_response(fragment)
+
+
+@api_v2.get('/version')
+def get_version() -> VersionResponse:
+    return VersionResponse(data_version=current().v2.data_version)
+
+
+@api_v2.get('/changes', response_model=ChangesResponse)
+def get_changes(
+    since: str = Query(..., examples=['2025-08-03'], description='Data version the client currently has'),
+):
+    """
+    Get the divisions added, removed and changed since the given data version.
+
+    If the server doesn't know that version, it responds with 404, and the client needs to re-fetch everything.
+    """
+    try:
+        content = compute_changes(since, current().v2.data_version)
+    except UnknownDataVersionError as e:
+        raise DataVersionNotAvailableError(f'No data to compare with version {since[:20]}') from e
+    return json_response(content)
 
 
-@api_v2.get('/search/provinces')
+@api_v2.get('/search/provinces', response_model=tuple[ProvinceResponse, ...])
 async def search_provinces(
     q: str = Query(..., min_length=1, description='Search query for province names'),
-    limit: int = Query(10, ge=1, le=50, description='Maximum number of results to return')
-) -> tuple[ProvinceResponse, ...]:
+    limit: int = Query(10, ge=1, le=50, description='Maximum number of results to return'),
+) -> Response:
     """Search provinces by name with fuzzy matching support."""
-    provinces = sorted(Province.iter_all(), key=attrgetter('code'))
-    keywords = q.strip().lower().split()
-    
-    if keywords:
-        logger.info('Searching provinces by keywords: {}', keywords)
-        provinces = filter_provinces_by_keywords(provinces, keywords)
-    
-    # Limit results
-    limited_provinces = list(provinces)[:limit]
-    return tuple(ProvinceResponse(**asdict(p)) for p in limited_provinces)
+    logger.info('Searching provinces by: {}', q)
+    data = current().v2
+    provinces = core.search_provinces(q, limit, data)
+    return json_response(data.provinces.render_many(int(p.code) for p in provinces))
 
 
-@api_v2.get('/search/wards')
+@api_v2.get('/search/wards', response_model=tuple[WardResponse, ...])
 async def search_wards(
     q: str = Query(..., min_length=1, description='Search query for ward names'),
     province: int = Query(0, description='Filter by province code (0 for all provinces)'),
-    limit: int = Query(20, ge=1, le=100, description='Maximum number of results to return')
-) -> tuple[WardResponse, ...]:
+    limit: int = Query(20, ge=1, le=100, description='Maximum number of results to return'),
+) -> Response:
     """Search wards by name with optional province filtering."""
-    # Get wards based on province filter
-    if province:
-        try:
-            province_code = ProvinceCode(province)
-            wards = Ward.iter_by_province(province_code)
-        except ValueError:
-            raise HTTPException(400, detail=f'Invalid province code: {province}')
-    else:
-        wards = Ward.iter_all()
-    
-    # Convert to tuple for multiple iterations
-    wards_list = tuple(wards)
-    
-    # Filter by search keywords
-    keywords = q.strip().lower().split()
-    if keywords:
-        logger.info('Searching wards by keywords: {} (province: {})', keywords, province or 'all')
-        filtered_wards = filter_wards_by_keywords(wards_list, keywords)
-    else:
-        filtered_wards = wards_list
-    
-    # Limit results
-    limited_wards = list(filtered_wards)[:limit]
-    return tuple(WardResponse(**asdict(w)) for w in limited_wards)
+    data = current().v2
+    if province and province not in data.provinces.records:
+        raise HTTPException(400, detail=f'Invalid province code: {province}')
+    logger.info('Searching wards by: {} (province: {})', q, province or 'all')
+    wards = core.search_wards(q, province, limit, data)
+    return json_response(data.wards.render_many(int(w.code) for w in wards))
 
 
-@api_v2.get('/search/all')
+@api_v2.get('/search/all', response_model=dict[str, tuple[ProvinceResponse | WardResponse, ...]])
 async def search_all(
     q: str = Query(..., min_length=1, description='Search query for provinces and wards'),
-    limit: int = Query(15, ge=1, le=50, description='Maximum number of results per type')
-) -> dict[str, tuple[ProvinceResponse | WardResponse, ...]]:
+    limit: int = Query(15, ge=1, le=50, description='Maximum number of results per type'),
+) -> Response:
     """Search both provinces and wards simultaneously."""
-    keywords = q.strip().lower().split()
-    logger.info('Searching all divisions by keywords: {}', keywords)
-    
-    # Search provinces
-    provinces = sorted(Province.iter_all(), key=attrgetter('code'))
-    filtered_provinces = filter_provinces_by_keywords(provinces, keywords)
-    limited_provinces = list(filtered_provinces)[:limit]
-    
-    # Search wards
-    wards = tuple(Ward.iter_all())
-    filtered_wards = filter_wards_by_keywords(wards, keywords)
-    limited_wards = list(filtered_wards)[:limit]
-    
-    return {
-        'provinces': tuple(ProvinceResponse(**asdict(p)) for p in limited_provinces),
-        'wards': tuple(WardResponse(**asdict(w)) for w in limited_wards)
-    }
-
-
-def filter_provinces_by_keywords(provinces: Sequence[Province], keywords: Iterable[str]):
-    # Mapping of province code -> unaccent province
-    unaccent_province_mapping = {p.code: unidecode(p.name).lower() for p in provinces}
-    unaccent_keywords = tuple(unidecode(w) for w in keywords)
-
-    def is_name_matched(province: Province):
-        name = unaccent_province_mapping[province.code]
-        return all(word in name for word in unaccent_keywords)
-
-    return filter(is_name_matched, provinces)
-
+    logger.info('Searching all divisions by: {}', q)
+    data = current().v2
+    provinces = core.search_provinces(q, limit, data)
+    wards = core.search_wards(q, 0, limit, data)
+    content = (
+        b'{"provinces":'
+        + data.provinces.render_many(int(p.code) for p in provinces)
+        + b',"wards":'
+        + data.wards.render_many(int(w.code) for w in wards)
+        + b'}'
+    )
+    return json_response(content)
+
+
+@api_v2.websocket('/search/session')
+async def search_session(
+    websocket: WebSocket,
+    kind: Literal['provinces', 'wards'] = 'wards',
+    province: int = Query(0, description='Filter wards by province code (0 for all provinces)'),
+    limit: int = Query(20, ge=1, le=100, description='Maximum number of results to return per query'),
+):
+    """
+    Type-ahead search: send the query as a text message on each keystroke, get back the matching divisions as JSON.
 
-def filter_wards_by_keywords(wards: Sequence[Ward], keywords: Iterable[str]) -> Iterator[Ward]:
-    # Mapping of ward code -> unaccent name
-    unaccent_ward_mapping = {w.code: unidecode(w.name).lower() for w in wards}
-    unaccent_keywords = tuple(unidecode(w) for w in keywords)
+    Matching is the same as `/search/provinces` and `/search/wards`, but each query is refined from the previous ones.
+    """
 
-    def is_name_matched(ward: Ward):
-        name = unaccent_ward_mapping[ward.code]
-        return all(word in name for word in unaccent_keywords)
+    def make_session(snapshot: Snapshot):
+        data = snapshot.v2
+        index = data.provinces if kind == 'provinces' else data.wards
+        return core.search_session(kind, province, data), index
 
-    return filter(is_name_matched, wards)
+    await typeahead.serve(websocket, make_session, limit)
 
 
 @api_v2.get('/parse-address')
 async def parse_address(address: str = Query(..., description='Full address string to parse (2-level structure)')):
     """
     Parse Vietnamese address string into structured components (Province -> Ward only).
-    
+
     API v2 uses 2-level structure: Province and Ward (no District level).
-    
+
     Example inputs:
     - "456 haha, Xã Quang Trọng, Tỉnh Cao Bằng"
     - "Tỉnh Cao Bằng"
     - "Xã Quang Trọng, Cao Bằng"
-    
+
     Returns structured address with codes for province, ward and street.
     """
     logger.info('Parsing address (v2): {}', address)
-    
-    # Split by comma and clean up
-    parts = [p.strip() for p in address.split(',')]
-    
-    result = {
-        'province': None,
-        'province_code': None,
-        'ward': None,
-        'ward_code': None,
-        'street': None
-    }
-    
-    # Find province (usually last or mentioned with "Tỉnh/Thành phố")
-    province_found = None
-    for part in reversed(parts):
-        for province in Province.iter_all():
-            # Check if province name matches (with or without prefix)
-            part_normalized = unidecode(part.lower())
-            province_normalized = unidecode(province.name.lower())
-            
-            # Remove common prefixes for matching
-            part_clean = re.sub(r'^(tinh|thanh pho|tp\.?)\s+', '', part_normalized)
-            province_clean = re.sub(r'^(tinh|thanh pho|tp\.?)\s+', '', province_normalized)
-            
-            if part_clean in province_clean or province_clean in part_clean:
-                province_found = province
-                result['province'] = province.name
-                result['province_code'] = province.code
-                break
-        if province_found:
-            break
-    
-    if not province_found:
-        # Try partial matching
-        for part in reversed(parts):
-            part_normalized = unidecode(part.lower()).strip()
-            for province in Province.iter_all():
-                province_name_simple = unidecode(province.name.lower())
-                # Check if significant part of province name is in the input
-                if len(part_normalized) >= 3 and part_normalized in province_name_simple:
-                    province_found = province
-                    result['province'] = province.name
-                    result['province_code'] = province.code
-                    break
-            if province_found:
-                break
-    
-    # Find ward if province found
-    if province_found:
-        province_code = ProvinceCode(province_found.code)
-        wards = list(Ward.iter_by_province(province_code))
-        
-        for part in parts:
-            for ward in wards:
-                part_normalized = unidecode(part.lower())
-                ward_normalized = unidecode(ward.name.lower())
-                
-                # Remove common prefixes
-                part_clean = re.sub(r'^(phuong|xa|thi tran|tt\.?)\s+', '', part_normalized)
-                ward_clean = re.sub(r'^(phuong|xa|thi tran|tt\.?)\s+', '', ward_normalized)
-                
-                if part_clean in ward_clean or ward_clean in part_clean:
-                    result['ward'] = ward.name
-                    result['ward_code'] = ward.code
-                    break
-            if result['ward']:
-                break
-    
-    # Extract street (first part that doesn't match any division)
-    for part in parts:
-        part_normalized = unidecode(part.lower())
-        is_division = False
-        
-        # Check if this part matches any found division
-        for key in ['province', 'ward']:
-            if result[key] and part_normalized in unidecode(result[key].lower()):
-                is_division = True
-                break
-        
-        if not is_division and part.strip():
-            # This might be street/building number
-            result['street'] = part.strip()
-            break
-    
-    return result
+    return core.parse_address(address)
+
+
+@api_v2.get('/parse-address/candidates')
+async def parse_address_candidates(
+    address: str = Query(..., description='Full address string to parse'),
+    k: int = Query(5, ge=1, le=10, description='Maximum number of candidates to return'),
+):
+    """
+    Parse Vietnamese address string into the combinations of province and ward it may name, the most likely first.
+
+    Each candidate has a `confidence`, from 0 to 1, of how well the parts of the address match the names.
+    Levels missing from the address are filled in from the lower levels found. Useful for ambiguous addresses,
+    like "Phường An Phú", to let the user choose.
+    """
+    logger.info('Parsing address candidates (v2): {}', address)
+    return core.parse_address_candidates(address, k)
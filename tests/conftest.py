@@ -0,0 +1,11 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+
+
+@pytest.fixture(scope='session')
+def client():
+    # Loads the data and builds the indexes once for all tests
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,78 @@
+import pytest
+
+from api.core import v1, v2
+
+
+@pytest.mark.parametrize(
+    'address, expected',
+    [
+        (
+            '456 haha, Xã Quang Trọng, Huyện Thạch An, Tỉnh Cao Bằng',
+            {'province_code': 4, 'district_code': 53, 'ward_code': 1813, 'street': '456 haha'},
+        ),
+        ('Tỉnh Cao Bằng', {'province_code': 4, 'district_code': None, 'ward_code': None, 'street': None}),
+        ('Huyện Thạch An, Cao Bằng', {'province_code': 4, 'district_code': 53, 'ward_code': None, 'street': None}),
+        (
+            '12 Lê Lợi, P. Bến Thành, Q.1, TP.HCM',
+            {'province_code': 79, 'district_code': 760, 'ward_code': 26743, 'street': '12 Lê Lợi'},
+        ),
+    ],
+)
+def test_parse_address_v1(address: str, expected: dict):
+    parsed = v1.parse_address(address)
+    assert {k: getattr(parsed, k) for k in expected} == expected
+
+
+@pytest.mark.parametrize(
+    'address, expected',
+    [
+        # The commune was merged in 2025, only the province is left
+        ('456 haha, Xã Quang Trọng, Tỉnh Cao Bằng', {'province_code': 4, 'ward_code': None, 'street': '456 haha'}),
+        ('Tỉnh Cao Bằng', {'province_code': 4, 'ward_code': None, 'street': None}),
+        ('Phường Ba Đình, Hà Nội', {'province_code': 1, 'ward_code': 4, 'street': None}),
+        ('12 Lê Lợi, P. Bến Thành, Q.1, TP.HCM', {'province_code': 79, 'ward_code': 26743, 'street': '12 Lê Lợi'}),
+        ('so 5, phuong ben thanh, tp ho chi minh', {'province_code': 79, 'ward_code': 26743, 'street': 'so 5'}),
+        # Former province, and alias without division type
+        ('Bình Dương', {'province_code': 79, 'ward_code': None, 'street': None}),
+        ('Sài Gòn', {'province_code': 79, 'ward_code': None, 'street': None}),
+    ],
+)
+def test_parse_address_v2(address: str, expected: dict):
+    parsed = v2.parse_address(address)
+    assert {k: getattr(parsed, k) for k in expected} == expected
+
+
+@pytest.mark.parametrize('address', ['12 Nguyễn Trãi', 'Nguyễn Trãi', 'số 5 ngõ 12', ''])
+def test_parse_street_only(address: str):
+    parsed = v2.parse_address(address)
+    assert (parsed.province_code, parsed.ward_code) == (None, None)
+    assert parsed.street == (address or None)
+    parsed_v1 = v1.parse_address(address)
+    assert (parsed_v1.province_code, parsed_v1.district_code, parsed_v1.ward_code) == (None, None, None)
+    assert parsed_v1.street == (address or None)
+
+
+def test_parse_ambiguous():
+    # Wards of several provinces have this name: none is chosen, all are candidates.
+    assert v2.parse_address('Phường An Phú').ward_code is None
+    candidates = v2.parse_address_candidates('Phường An Phú', 10)
+    assert len(candidates) > 1
+    assert {c.ward for c in candidates} == {'Phường An Phú', 'Xã An Phú'}
+    confidences = [c.confidence for c in candidates]
+    assert confidences == sorted(confidences, reverse=True)
+    # Same name and prefix first
+    assert candidates[0].ward == 'Phường An Phú'
+    assert candidates[0].confidence > candidates[-1].confidence
+
+
+@pytest.mark.parametrize('k', [1, 5, 10])
+def test_parse_candidates_k(k: int):
+    assert len(v1.parse_address_candidates('Tân Thành', k)) == k
+    assert len(v2.parse_address_candidates('Tân Thành', k)) == k
+
+
+def test_parse_nothing_found():
+    candidates = v2.parse_address_candidates('xyz')
+    assert len(candidates) == 1
+    assert candidates[0].confidence == 0
+    assert candidates[0].street == 'xyz'
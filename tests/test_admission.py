@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from api.admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    ConcurrencyLimiter,
+    LocalBackend,
+    RouteClass,
+    classify,
+)
+from api.config import settings
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_request(path: str, query: str = '', method: str = 'GET') -> Request:
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query.encode(),
+        'headers': [],
+        'client': ('192.0.2.1', 1234),
+    }
+    return Request(scope)
+
+
+def test_local_backend_burst():
+    backend = LocalBackend(clock=Clock())
+    taken = [asyncio.run(backend.take('a', 1, rate=1, burst=5)) for _ in range(6)]
+    assert taken == [True] * 5 + [False]
+    # Other clients have their own bucket
+    assert asyncio.run(backend.take('b', 1, rate=1, burst=5))
+
+
+def test_local_backend_refill():
+    clock = Clock()
+    backend = LocalBackend(clock=clock)
+    assert asyncio.run(backend.take('a', 4, rate=2, burst=4))
+    assert not asyncio.run(backend.take('a', 1, rate=2, burst=4))
+    clock.now += 1
+    assert asyncio.run(backend.take('a', 2, rate=2, burst=4))
+    assert not asyncio.run(backend.take('a', 1, rate=2, burst=4))
+    # Never refilled beyond the burst size
+    clock.now += 100
+    assert asyncio.run(backend.take('a', 4, rate=2, burst=4))
+    assert not asyncio.run(backend.take('a', 1, rate=2, burst=4))
+
+
+def test_local_backend_evicts_full_buckets():
+    clock = Clock()
+    backend = LocalBackend(clock=clock)
+    backend.max_keys = 2
+    asyncio.run(backend.take('a', 1, rate=1, burst=5))
+    clock.now += 10
+    asyncio.run(backend.take('b', 1, rate=1, burst=5))
+    asyncio.run(backend.take('c', 1, rate=1, burst=5))
+    assert set(backend.buckets) == {'b', 'c'}
+
+
+@pytest.mark.parametrize(
+    'path, query, expected',
+    [
+        ('/api/v1/parse-address', 'address=x', RouteClass.PARSE),
+        ('/api/v2/parse-address/candidates', 'address=x', RouteClass.PARSE),
+        ('/api/v2/search/wards', 'q=x', RouteClass.SEARCH),
+        ('/api/v2/w/', 'search=x', RouteClass.SEARCH),
+        ('/api/v1/', 'depth=3', RouteClass.DUMP),
+        ('/api/v1/', '', None),
+        ('/api/v1/', 'depth=1', None),
+        ('/api/v1/w/', '', RouteClass.DUMP),
+        ('/api/v2/w/', '', RouteClass.DUMP),
+        ('/api/v2/w/', 'province=1', None),
+        ('/api/v2/w/', 'limit=20', None),
+        ('/api/v1/d/', 'codes=1,2', None),
+        ('/api/v1/p/', '', None),
+        ('/api/v2/p/1', '', None),
+    ],
+)
+def test_classify(path: str, query: str, expected: RouteClass | None):
+    assert classify(make_request(path, query)) == expected
+
+
+def make_client(controller: AdmissionController) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, admission=controller)
+
+    @app.get('/api/v2/p/')
+    def provinces():
+        return []
+
+    @app.get('/api/v2/w/')
+    def wards():
+        return []
+
+    return TestClient(app)
+
+
+def test_rate_limited(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'rate_limit', 1)
+    monkeypatch.setattr(settings, 'rate_limit_burst', 25)
+    client = make_client(AdmissionController(LocalBackend(), {}))
+    assert client.get('/api/v2/w/').status_code == 200
+    for _ in range(5):
+        assert client.get('/api/v2/p/').status_code == 200
+    # The full list costs 20 tokens, 0 are left
+    response = client.get('/api/v2/w/')
+    assert response.status_code == 429
+    assert response.json() == {'detail': 'too-many-requests'}
+    assert response.headers['Retry-After'] == '20'
+
+
+def test_rate_limit_disabled(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'rate_limit', 0)
+    client = make_client(AdmissionController(LocalBackend(), {}))
+    for _ in range(10):
+        assert client.get('/api/v2/w/').status_code == 200
+
+
+def test_server_busy(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'rate_limit', 0)
+    limiter = ConcurrencyLimiter(1, max_queue=0, timeout=1)
+    client = make_client(AdmissionController(LocalBackend(), {RouteClass.DUMP: limiter}))
+    # A dump in progress holds the only slot
+    assert asyncio.run(limiter.acquire())
+    response = client.get('/api/v2/w/')
+    assert response.status_code == 503
+    assert response.json() == {'detail': 'server-busy'}
+    assert response.headers['Retry-After'] == '1'
+    # Cheap requests are not limited
+    assert client.get('/api/v2/p/').status_code == 200
+    limiter.release()
+    assert client.get('/api/v2/w/').status_code == 200
+    # The slot is released after the response
+    assert not limiter.semaphore.locked()
+
+
+def test_queue_timeout():
+    async def run() -> list[bool]:
+        limiter = ConcurrencyLimiter(1, max_queue=1, timeout=0.01)
+        assert await limiter.acquire()
+        # Waits in the queue, in vain
+        return [await limiter.acquire()]
+
+    assert asyncio.run(run()) == [False]
+
+
+def test_rejection_allows_cors(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, 'rate_limit', 1)
+    monkeypatch.setattr(settings, 'rate_limit_burst', 1)
+    headers = {'Origin': 'https://example.com'}
+    assert client.get('/api/v2/p/1', headers=headers).status_code == 200
+    response = client.get('/api/v2/p/1', headers=headers)
+    assert response.status_code == 429
+    # Browsers can read the rejection, and when to retry
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+    assert response.headers['Cache-Control'] == 'no-store'
@@ -0,0 +1,69 @@
+import gzip
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import changes
+from api.changes import UnknownDataVersionError, compute_changes, diff_records, take_snapshot
+from api.lookup import render
+from api.snapshot import current
+
+
+OLD_VERSION = '2000-01-01'
+
+
+def test_diff_records():
+    old = [{'code': 1, 'name': 'A'}, {'code': 2, 'name': 'B'}, {'code': 3, 'name': 'C'}]
+    new = [{'code': 1, 'name': 'A'}, {'code': 3, 'name': 'C2'}, {'code': 4, 'name': 'D'}]
+    assert diff_records(old, new) == {
+        'added': [{'code': 4, 'name': 'D'}],
+        'removed': [2],
+        'changed': [{'code': 3, 'name': 'C2'}],
+    }
+
+
+@pytest.fixture
+def old_snapshot(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """An older version of the current data, with a province fewer, a ward more and a ward renamed."""
+    snapshot = take_snapshot(current().v2)
+    snapshot['data_version'] = OLD_VERSION
+    added = snapshot['provinces'].pop()
+    snapshot['wards'].append({**snapshot['wards'][0], 'code': 999999, 'name': 'Phường Cũ'})
+    renamed = dict(snapshot['wards'][1])
+    snapshot['wards'][1] = {**renamed, 'name': 'Phường Tên Cũ'}
+    (tmp_path / f'{OLD_VERSION}.json.gz').write_bytes(gzip.compress(render(snapshot)))
+    monkeypatch.setattr(changes, 'SNAPSHOT_DIR', tmp_path)
+    compute_changes.cache_clear()
+    yield added, renamed
+    compute_changes.cache_clear()
+
+
+def test_changes(client: TestClient, old_snapshot):
+    added, renamed = old_snapshot
+    response = client.get('/api/v2/changes', params={'since': OLD_VERSION})
+    assert response.status_code == 200
+    result = response.json()
+    assert result['since'] == OLD_VERSION
+    assert result['data_version'] == current().v2.data_version
+    assert result['provinces'] == {'added': [added], 'removed': [], 'changed': []}
+    assert result['wards'] == {'added': [], 'removed': [999999], 'changed': [renamed]}
+
+
+def test_no_changes(client: TestClient):
+    version = current().v2.data_version
+    result = client.get('/api/v2/changes', params={'since': version}).json()
+    for level in ('provinces', 'wards'):
+        assert result[level] == {'added': [], 'removed': [], 'changed': []}
+
+
+@pytest.mark.parametrize('since', ['2020-01-01', '../../x', '2025-08-03/../../x', 'garbage'])
+def test_unknown_version(client: TestClient, monkeypatch: pytest.MonkeyPatch, since: str):
+    def walk_all(data):
+        raise AssertionError('The data must not be walked for an unknown version')
+
+    monkeypatch.setattr(changes, 'take_snapshot', walk_all)
+    response = client.get('/api/v2/changes', params={'since': since})
+    assert response.status_code == 404
+    with pytest.raises(UnknownDataVersionError):
+        compute_changes(since, current().v2.data_version)
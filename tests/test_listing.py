@@ -0,0 +1,99 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api.lookup import MAX_BULK_CODES
+
+
+LIST_PATHS = ['/api/v1/p/', '/api/v1/d/', '/api/v1/w/', '/api/v2/p/', '/api/v2/w/']
+
+
+def codes_of(response) -> list[int]:
+    assert response.status_code == 200
+    return [d['code'] for d in response.json()]
+
+
+@pytest.fixture(scope='module')
+def all_codes(client: TestClient) -> dict[str, list[int]]:
+    return {path: codes_of(client.get(path)) for path in LIST_PATHS}
+
+
+@pytest.mark.parametrize('path', LIST_PATHS)
+def test_multi_get(client: TestClient, all_codes: dict[str, list[int]], path: str):
+    first, second, third = all_codes[path][:3]
+    # Requested order, without duplicates and unknown codes
+    codes = [third, first, third, 999999, second]
+    full = {d['code']: d for d in client.get(path).json()}
+    response = client.post(path, json={'codes': codes})
+    assert response.json() == [full[third], full[first], full[second]]
+    assert codes_of(client.get(path, params={'codes': ','.join(map(str, codes))})) == [third, first, second]
+
+
+@pytest.mark.parametrize('path', LIST_PATHS)
+def test_multi_get_too_many(client: TestClient, path: str):
+    codes = list(range(1, MAX_BULK_CODES + 2))
+    assert client.post(path, json={'codes': codes[:-1]}).status_code == 200
+    assert client.post(path, json={'codes': codes}).status_code == 422
+    assert client.get(path, params={'codes': ','.join(map(str, codes))}).status_code == 422
+
+
+@pytest.mark.parametrize('path', LIST_PATHS)
+def test_pagination(client: TestClient, all_codes: dict[str, list[int]], path: str):
+    limit = min(len(all_codes[path]) // 3 + 1, MAX_BULK_CODES)
+    pages = []
+    response = client.get(path, params={'limit': limit})
+    while 'Link' in response.headers:
+        pages.append(codes_of(response))
+        next_url = response.headers['Link'].removeprefix('<').removesuffix('>; rel="next"')
+        assert f'limit={limit}' in next_url
+        response = client.get(next_url)
+    # The last page has no link
+    pages.append(codes_of(response))
+    assert len(pages) >= 3
+    assert all(len(p) == limit for p in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+    assert [c for p in pages for c in p] == sorted(all_codes[path])
+
+
+def test_pagination_after(client: TestClient, all_codes: dict[str, list[int]]):
+    codes = sorted(all_codes['/api/v2/w/'])
+    assert codes_of(client.get('/api/v2/w/', params={'after': codes[9], 'limit': 3})) == codes[10:13]
+    response = client.get('/api/v2/w/', params={'after': codes[-3]})
+    assert codes_of(response) == codes[-2:]
+    assert 'Link' not in response.headers
+
+
+def test_pagination_within_province(client: TestClient):
+    wards = client.get('/api/v2/w/', params={'province': 1}).json()
+    codes = sorted(w['code'] for w in wards)
+    response = client.get('/api/v2/w/', params={'province': 1, 'limit': 5})
+    assert codes_of(response) == codes[:5]
+    assert 'province=1' in response.headers['Link']
+
+
+@pytest.mark.parametrize('path', LIST_PATHS)
+def test_fields(client: TestClient, path: str):
+    response = client.get(path, params={'fields': 'name,code', 'limit': 2})
+    # In the requested order
+    assert [list(d) for d in response.json()] == [['name', 'code']] * 2
+    assert client.get(path, params={'fields': 'code,password'}).status_code == 422
+
+
+@pytest.mark.parametrize(
+    'params',
+    [
+        {'codes': '70', 'province': 1},
+        {'codes': '70', 'search': 'hoan kiem'},
+        {'codes': '70', 'limit': 10},
+        {'codes': '70', 'after': 1},
+    ],
+)
+def test_codes_with_filters(client: TestClient, params: dict[str, str | int]):
+    response = client.get('/api/v2/w/', params=params)
+    assert response.status_code == 422
+    assert response.json()['title'] == 'Invalid listing query'
+
+
+def test_invalid_listing_query_v1(client: TestClient):
+    response = client.get('/api/v1/d/', params={'codes': '1,x'})
+    assert response.status_code == 422
+    assert response.json() == {'detail': 'invalid-listing-query'}
@@ -0,0 +1,39 @@
+import asyncio
+import gzip
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import prerender
+from api.main import app
+
+
+SAMPLE_PATHS = frozenset(
+    (
+        '/api/v1/',
+        '/api/v2/',
+        '/api/v1/p/',
+        '/api/v1/version',
+        '/api/v2/w/',
+        '/api/v1/p/1',
+        '/api/v1/d/1',
+        '/api/v1/w/1',
+        '/api/v2/p/1',
+        '/api/v2/w/70',
+    )
+)
+
+
+def test_render_all(client: TestClient, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    targets = [t for t in prerender.iter_targets() if t[0] in SAMPLE_PATHS]
+    monkeypatch.setattr(prerender, 'iter_targets', lambda: iter(targets))
+    assert asyncio.run(prerender.render_all(app, tmp_path)) == len(targets)
+    assert len(list(tmp_path.rglob('*.json'))) == len(targets)
+    for path, depth in targets:
+        response = client.get(path, params=None if depth is None else {'depth': depth})
+        assert response.status_code == 200
+        target = prerender.file_path(tmp_path, path, depth)
+        # Served in place of the app's response
+        assert target.read_bytes() == response.content
+        assert gzip.decompress(target.with_name(target.name + '.gz').read_bytes()) == response.content
@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api.core import v2
+from api.search import MAX_KEYWORDS, MAX_QUERY_LENGTH, IncrementalSearch, QueryTooLongError
+
+
+NAMES = {1: 'phuong phuc xa', 2: 'xa phuc hoa', 3: 'phuong hang bac'}
+
+
+def test_incremental_search():
+    session = IncrementalSearch(NAMES, [1, 2, 3])
+    assert session.search('phuc') == [1, 2]
+    assert session.search('phuc x') == [1, 2]
+    assert session.search('Phúc Xá') == [1, 2]
+    assert session.search('phuong') == [1, 3]
+    assert session.search('') == [1, 2, 3]
+
+
+@pytest.mark.parametrize('query', ['x' * (MAX_QUERY_LENGTH + 1), ' '.join('x' * (MAX_KEYWORDS + 1))])
+def test_incremental_search_too_long(query: str):
+    with pytest.raises(QueryTooLongError):
+        IncrementalSearch(NAMES, [1, 2, 3]).search(query)
+
+
+def test_search_ignores_aliases():
+    # Aliases are only for the address parser: "Hà Giang" was merged into Tuyên Quang.
+    names = [p.name for p in v2.search_provinces('ha')]
+    assert 'Tuyên Quang' not in names
+    assert 'Thành phố Hà Nội' in names
+    assert v2.search_provinces('sai gon') == []
+    assert [p.name for p in v2.search_provinces('hoa')] == ['Thanh Hóa', 'Khánh Hòa']
+
+
+def search_all(client: TestClient, **params) -> list[dict]:
+    response = client.get('/api/v1/search/', params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_search_all_paths(client: TestClient):
+    hits = search_all(client, q='hoan kiem')
+    assert {h['level'] for h in hits} == {'district', 'ward'}
+    for hit in hits:
+        if hit['level'] != 'ward':
+            continue
+        # Wards come with their district and province, as looked up by code
+        ward = client.get(f'/api/v1/w/{hit["code"]}').json()
+        district = client.get(f'/api/v1/d/{ward["district_code"]}').json()
+        province = client.get(f'/api/v1/p/{district["province_code"]}').json()
+        assert (hit['district_code'], hit['district_name']) == (district['code'], district['name'])
+        assert (hit['province_code'], hit['province_name']) == (province['code'], province['name'])
+        assert hit['full_name'] == f'{ward["name"]}, {district["name"]}, {province["name"]}'
+
+
+def test_search_all_province_filter(client: TestClient):
+    assert {h['province_code'] for h in search_all(client, q='hoan kiem')} > {1}
+    hits = search_all(client, q='hoan kiem', p=1)
+    assert hits
+    assert {h['province_code'] for h in hits} == {1}
+    # Provinces are in their own filter
+    assert [h['code'] for h in search_all(client, q='ha noi', p=1) if h['level'] == 'province'] == [1]
+
+
+def test_search_all_limit(client: TestClient):
+    assert len(search_all(client, q='tan')) == 20
+    assert len(search_all(client, q='tan', limit=5)) == 5
+    assert client.get('/api/v1/search/', params={'q': 'tan', 'limit': 101}).status_code == 422
+
+
+@pytest.mark.parametrize('query', ['ha~', 'name:'])
+def test_search_all_invalid_query(client: TestClient, query: str):
+    response = client.get('/api/v1/search/', params={'q': query})
+    assert response.status_code == 422
+    assert response.json() == {'detail': 'unrecognized-search-query'}
@@ -0,0 +1,25 @@
+import os
+import socket
+
+import pytest
+
+from api.serve import Supervisor
+
+
+def crash():
+    raise RuntimeError('Boom')
+
+
+def stop():
+    raise SystemExit(3)
+
+
+@pytest.mark.parametrize('run_worker, expected', [(lambda: None, 0), (crash, 1), (stop, 1)])
+def test_worker_exit_status(run_worker, expected: int, monkeypatch: pytest.MonkeyPatch):
+    with socket.socket() as sock:
+        supervisor = Supervisor(None, sock, 1, 'info', '127.0.0.1')
+        monkeypatch.setattr(supervisor, 'run_worker', run_worker)
+        supervisor.spawn()
+        (pid,) = supervisor.children
+        _pid, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == expected
@@ -0,0 +1,98 @@
+import json
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from vietnam_provinces import NESTED_DIVISIONS_JSON_PATH
+
+from api import snapshot
+from api.core import v2 as core
+from api.snapshot import NESTED_FILENAME, VERSION_FILENAME, Watcher, current, reload
+
+
+def write_data(data_dir: Path, version: str, first_ward: str | None = None):
+    """Write v2 data to `data_dir`, with another name for the first ward of Hà Nội if given."""
+    folder = data_dir / 'v2'
+    folder.mkdir(parents=True, exist_ok=True)
+    nested = json.loads(NESTED_DIVISIONS_JSON_PATH.read_bytes())
+    if first_ward:
+        nested[0]['wards'][0]['name'] = first_ward
+    (folder / NESTED_FILENAME).write_text(json.dumps(nested, ensure_ascii=False))
+    (folder / VERSION_FILENAME).write_text(version)
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def keep_current(monkeypatch: pytest.MonkeyPatch):
+    # Restores the snapshot in use by the other tests
+    monkeypatch.setattr(snapshot, '_current', current())
+
+
+def test_reload(tmp_path: Path, keep_current):
+    write_data(tmp_path, '2025-01-01')
+    assert reload(tmp_path)
+    assert current().v2.data_version == '2025-01-01'
+
+
+def test_reload_keeps_snapshot_on_failure(tmp_path: Path, keep_current):
+    write_data(tmp_path, '2025-01-01')
+    (tmp_path / 'v2' / NESTED_FILENAME).write_text('[{"name": ')
+    old = current()
+    assert not reload(tmp_path)
+    assert current() is old
+
+
+def test_watcher(tmp_path: Path, keep_current, monkeypatch: pytest.MonkeyPatch):
+    write_data(tmp_path, '2025-01-01')
+    calls = []
+
+    def counted_reload(data_dir: Path | None) -> bool:
+        calls.append(data_dir)
+        return reload(data_dir)
+
+    monkeypatch.setattr(snapshot, 'reload', counted_reload)
+    watcher = Watcher(tmp_path, 0.02)
+    watcher.start()
+    try:
+        (tmp_path / 'v2' / VERSION_FILENAME).write_text('2025-02-02')
+        wait_for(lambda: current().v2.data_version == '2025-02-02')
+        assert len(calls) == 1
+        # A broken file is loaded once, not on every poll
+        (tmp_path / 'v2' / NESTED_FILENAME).write_text('[{"name": ')
+        wait_for(lambda: len(calls) == 2)
+        time.sleep(0.2)
+        assert len(calls) == 2
+        assert current().v2.data_version == '2025-02-02'
+        # But again when triggered
+        watcher.trigger()
+        wait_for(lambda: len(calls) == 3)
+    finally:
+        watcher.stop()
+
+
+def test_request_keeps_snapshot(client: TestClient, tmp_path: Path, keep_current, monkeypatch: pytest.MonkeyPatch):
+    write_data(tmp_path, '2025-01-01', first_ward='Phường Thử Nghiệm')
+    new = snapshot.load(tmp_path)
+    original = core.search_wards
+
+    def search_then_swap(*args, **kwargs):
+        results = original(*args, **kwargs)
+        snapshot.swap(new)
+        return results
+
+    monkeypatch.setattr(core, 'search_wards', search_then_swap)
+    # The ward is rendered from the snapshot in which it was found
+    response = client.get('/api/v2/w/', params={'province': 1, 'search': 'hoan kiem'})
+    assert [w['name'] for w in response.json()] == ['Phường Hoàn Kiếm']
+    monkeypatch.setattr(core, 'search_wards', original)
+    assert current() is new
+    response = client.get('/api/v2/w/70')
+    assert response.json()['name'] == 'Phường Thử Nghiệm'
@@ -0,0 +1,66 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from api.admission import LocalBackend, controller
+from api.config import settings
+from api.search import MAX_QUERY_LENGTH
+
+
+@pytest.mark.parametrize('path', ['/api/v2/search/session?kind=wards', '/api/v1/search/session?kind=wards'])
+def test_refinement(client: TestClient, path: str):
+    with client.websocket_connect(path + '&limit=5') as websocket:
+        websocket.send_text('ha')
+        broad = websocket.receive_json()
+        websocket.send_text('ha n')
+        narrow = websocket.receive_json()
+        websocket.send_text('')
+        everything = websocket.receive_json()
+    assert broad['q'] == 'ha'
+    assert narrow['q'] == 'ha n'
+    assert 0 < narrow['total'] < broad['total'] < everything['total']
+    assert len(narrow['results']) == 5
+    assert all('ha' in r['codename'] for r in narrow['results'])
+
+
+def test_province_filter(client: TestClient):
+    with client.websocket_connect('/api/v2/search/session?kind=wards&province=1&limit=100') as websocket:
+        websocket.send_text('phuong')
+        result = websocket.receive_json()
+    assert result['total'] > 0
+    assert {r['province_code'] for r in result['results']} == {1}
+
+
+def close_code(websocket, message: str | bytes) -> tuple[int, str]:
+    if isinstance(message, bytes):
+        websocket.send_bytes(message)
+    else:
+        websocket.send_text(message)
+    with pytest.raises(WebSocketDisconnect) as e:
+        websocket.receive_json()
+    return e.value.code, e.value.reason
+
+
+def test_query_too_long(client: TestClient):
+    with client.websocket_connect('/api/v2/search/session') as websocket:
+        assert close_code(websocket, 'x' * (MAX_QUERY_LENGTH + 1)) == (1009, 'query-too-long')
+
+
+def test_binary_message(client: TestClient):
+    with client.websocket_connect('/api/v2/search/session') as websocket:
+        assert close_code(websocket, b'ha') == (1003, 'text-only')
+
+
+def test_rate_limited(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    # Opening costs 2 tokens, each query 1, and the bucket never refills during the test
+    monkeypatch.setattr(settings, 'rate_limit', 0.001)
+    monkeypatch.setattr(settings, 'rate_limit_burst', 3)
+    monkeypatch.setattr(controller(), 'backend', LocalBackend())
+    with client.websocket_connect('/api/v2/search/session') as websocket:
+        websocket.send_text('ha')
+        assert websocket.receive_json()['q'] == 'ha'
+        assert close_code(websocket, 'ha n') == (1013, 'too-many-requests')
+    with pytest.raises(WebSocketDisconnect) as e:
+        with client.websocket_connect('/api/v2/search/session'):
+            pass
+    assert e.value.code == 1013